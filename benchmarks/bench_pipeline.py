@@ -0,0 +1,146 @@
+"""End-to-end benchmark of cli.main on a synthetic jj repo, fully offline.
+
+Builds a fake repository, replaces provider.get_provider with a stub chat
+model of configurable latency, runs `jj-aidesc --apply` and reports the
+wall time, the number of jj subprocesses and a per-phase breakdown. Phase
+times are summed over calls, so concurrent generation can exceed the wall
+time. Requires jj on PATH.
+
+    uv run python benchmarks/bench_pipeline.py --commits 30 --latency 0.5
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, chdir
+from functools import wraps
+from pathlib import Path
+from unittest import mock
+
+from click.testing import CliRunner
+from fake_repo import JJ_ENV, make_repo
+from stubs import StubChatModel, StubProvider
+
+from jj_aidesc import cli
+from jj_aidesc.ai import AI
+from jj_aidesc.jj import JJClient
+
+# (phase, owner, attribute) of every timed call
+PHASES = [
+    ("scan", JJClient, "get_commits_without_description"),
+    ("diff fetch", JJClient, "get_diff"),
+    ("diff fetch", JJClient, "get_diff_summary"),
+    ("prompt build", AI, "__init__"),
+    ("generation", AI, "generate_detached"),
+    ("apply", JJClient, "set_description"),
+    ("apply", JJClient, "set_descriptions"),
+]
+
+
+class Recorder:
+    """Accumulate time and call counts per phase, and count subprocesses."""
+
+    def __init__(self) -> None:
+        self.seconds: defaultdict[str, float] = defaultdict(float)
+        self.calls: Counter[str] = Counter()
+        self.subprocesses = 0
+        self._lock = threading.Lock()
+
+    def timed(self, phase: str, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds[phase] += time.perf_counter() - start
+                    self.calls[phase] += 1
+
+        return wrapper
+
+    def counting_popen(self):
+        recorder = self
+
+        class CountingPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs):
+                with recorder._lock:
+                    recorder.subprocesses += 1
+                super().__init__(*args, **kwargs)
+
+        return CountingPopen
+
+
+def run(repo: Path, latency: float, extra_args: list[str]) -> None:
+    recorder = Recorder()
+    model = StubChatModel(latency=latency)
+
+    with ExitStack() as stack:
+        for phase, owner, name in PHASES:
+            original = getattr(owner, name)
+            stack.enter_context(
+                mock.patch.object(owner, name, recorder.timed(phase, original))
+            )
+        stack.enter_context(
+            # Routing rules ask for one provider each, all served by the stub
+            mock.patch.object(
+                cli, "get_provider", lambda *args, **kwargs: StubProvider(model)
+            )
+        )
+        stack.enter_context(
+            mock.patch.object(subprocess, "Popen", recorder.counting_popen())
+        )
+        stack.enter_context(chdir(repo))
+
+        args = ["--apply", "--no-stream", "--no-cache", "--api-key", "stub"]
+        start = time.perf_counter()
+        result = CliRunner().invoke(cli.main, [*args, *extra_args])
+        wall = time.perf_counter() - start
+
+    if result.exit_code != 0:
+        raise SystemExit(f"jj-aidesc failed:\n{result.output}")
+
+    print(f"wall time    {wall * 1e3:10.1f} ms")
+    print(f"subprocesses {recorder.subprocesses:10d}")
+    print()
+    print(f"{'phase':<14}{'calls':>8}{'total ms':>12}{'mean ms':>12}")
+    for phase in dict.fromkeys(phase for phase, _, _ in PHASES):
+        calls = recorder.calls[phase]
+        total = recorder.seconds[phase] * 1e3
+        mean = total / calls if calls else 0.0
+        print(f"{phase:<14}{calls:>8}{total:>12.1f}{mean:>12.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--commits", type=int, default=20)
+    parser.add_argument("--files", type=int, default=3, help="files per commit")
+    parser.add_argument("--lines", type=int, default=50, help="lines per file")
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="model latency in seconds"
+    )
+    parser.add_argument("cli_args", nargs="*", help="extra jj-aidesc options, after --")
+    args = parser.parse_args()
+
+    if shutil.which("jj") is None:
+        raise SystemExit("jj is not installed or not in PATH")
+
+    os.environ.update(JJ_ENV)
+    with tempfile.TemporaryDirectory(prefix="jj-aidesc-bench-") as tmp:
+        repo = make_repo(Path(tmp) / "repo", args.commits, args.files, args.lines)
+        print(
+            f"{args.commits} commits x {args.files} files x {args.lines} lines, "
+            f"model latency {args.latency}s"
+        )
+        run(repo, args.latency, args.cli_args)
+
+
+if __name__ == "__main__":
+    main()
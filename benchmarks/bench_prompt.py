@@ -0,0 +1,75 @@
+"""Micro-benchmark of the per-call overhead of AI, excluding the network.
+
+Compares reusing one AI instance (prompt and chain built once per run)
+with building the chain for every commit, which is what every call used
+to pay before the chain was hoisted out of AI.generate.
+
+    uv run python benchmarks/bench_prompt.py --commits 200
+"""
+
+import argparse
+import statistics
+import time
+
+from stubs import StubChatModel, make_diff
+
+from jj_aidesc.ai import AI
+from jj_aidesc.prompts import PROMPTS
+
+
+def _report(name: str, samples: list[float]) -> None:
+    samples_us = sorted(s * 1e6 for s in samples)
+    p95 = samples_us[int(len(samples_us) * 0.95) - 1]
+    print(
+        f"{name:<24} mean {statistics.mean(samples_us):9.1f} us  "
+        f"median {statistics.median(samples_us):9.1f} us  p95 {p95:9.1f} us  "
+        f"total {sum(samples) * 1e3:8.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--style", choices=sorted(PROMPTS), default="follow")
+    args = parser.parse_args()
+
+    model = StubChatModel()
+    existing = [f"feat(module): change number {i}\n\n- detail" for i in range(10)]
+    diffs = [make_diff(i) for i in range(args.commits)]
+
+    def build() -> AI:
+        return AI(
+            model=model,
+            system_prompt=PROMPTS[args.style],
+            existing_descriptions=existing,
+        )
+
+    # Warm up imports and pydantic schema generation
+    build().generate_detached(diffs[0])
+
+    start = time.perf_counter()
+    ai = build()
+    build_time = time.perf_counter() - start
+
+    reused: list[float] = []
+    for diff in diffs:
+        start = time.perf_counter()
+        ai.generate_detached(diff)
+        reused.append(time.perf_counter() - start)
+
+    rebuilt: list[float] = []
+    for diff in diffs:
+        start = time.perf_counter()
+        build().generate_detached(diff)
+        rebuilt.append(time.perf_counter() - start)
+
+    print(f"{args.commits} commits, style {args.style}, stub model (no network)")
+    print(f"chain build once: {build_time * 1e3:.2f} ms")
+    _report("reused chain", reused)
+    _report("chain built per call", rebuilt)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Synthetic jj repositories for the benchmarks."""
+
+import os
+import subprocess
+from pathlib import Path
+
+# Author identity so jj does not warn about a missing user config
+JJ_ENV = {
+    "JJ_USER": "Benchmark",
+    "JJ_EMAIL": "bench@example.com",
+}
+
+
+def _jj(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["jj", *args],
+        cwd=repo,
+        env={**os.environ, **JJ_ENV},
+        capture_output=True,
+        check=True,
+    )
+
+
+def make_repo(path: Path, commits: int, files: int, lines: int) -> Path:
+    """Create a jj repo with `commits` undescribed commits on top of the root.
+
+    Each commit rewrites `files` files with `lines` lines of content that
+    differ from the previous commit, so every diff has roughly
+    `files * lines * 2` changed lines.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    _jj(path, "git", "init")
+    for commit in range(commits):
+        for index in range(files):
+            file = path / "src" / f"module_{index % 10}" / f"file_{index}.py"
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_text(
+                "".join(
+                    f"value_{index}_{line} = {commit * lines + line}\n"
+                    for line in range(lines)
+                )
+            )
+        # Snapshots the working copy into the current commit and starts a new one
+        _jj(path, "new")
+    return path
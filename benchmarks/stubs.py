@@ -0,0 +1,142 @@
+"""Offline stand-ins for the chat model and diffs used by the benchmarks."""
+
+import json
+import re
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.ai import UsageMetadata
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that answers instantly with a fixed description.
+
+    Replies are JSON, so both the structured-output path and the streaming
+    path of AI work unchanged; a request for several commits gets one
+    description per change ID. Token counts are estimated as chars / 4, and
+    each reply takes `latency` seconds to simulate the network.
+    """
+
+    message: str = "feat: update generated module\n\n- Adjust stub behaviour"
+    chunk_size: int = 8
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _usage(self, messages: list[BaseMessage], content: str) -> UsageMetadata:
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(content) // 4
+        return UsageMetadata(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+        )
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        change_ids = re.findall(
+            r'<commit change_id="([^"]+)">', str(messages[-1].content)
+        )
+        if change_ids:
+            content = json.dumps(
+                {
+                    "descriptions": [
+                        {"change_id": change_id, "message": self.message}
+                        for change_id in change_ids
+                    ]
+                }
+            )
+        else:
+            content = json.dumps({"message": self.message})
+        message = AIMessage(
+            content=content, usage_metadata=self._usage(messages, content)
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        content = json.dumps({"message": self.message})
+        chunks = range(0, len(content), self.chunk_size)
+        for start in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=content[start : start + self.chunk_size])
+            )
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="", usage_metadata=self._usage(messages, content)
+            )
+        )
+
+    def with_structured_output(
+        self, schema: dict | type, *, include_raw: bool = False, **kwargs: Any
+    ):
+        if not (isinstance(schema, type) and issubclass(schema, BaseModel)):
+            raise TypeError("StubChatModel only supports pydantic schemas")
+        model: type[BaseModel] = schema
+
+        def parse(raw: AIMessage):
+            parsed = model.model_validate_json(raw.text)
+            if include_raw:
+                return {"raw": raw, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return self | RunnableLambda(parse)
+
+
+class StubProvider:
+    """Provider serving a StubChatModel, in place of provider.get_provider."""
+
+    def __init__(self, chat_model: BaseChatModel):
+        self.name = "stub"
+        self.model_name = "stub"
+        self.summary_model_name = "stub"
+        self.chat_model = chat_model
+        self.summary_chat_model = chat_model
+
+    def warm_up(self) -> None:
+        pass
+
+    def cached_chat_model(self, system_text: str) -> BaseChatModel | None:
+        return None
+
+    def drop_cached_chat_model(self, chat_model: BaseChatModel) -> None:
+        pass
+
+
+def make_diff(index: int, files: int = 3, hunks: int = 4, lines: int = 12) -> str:
+    """Build a synthetic git diff, distinct per index."""
+    parts = []
+    for f in range(files):
+        path = f"src/module_{index}/file_{f}.py"
+        parts.append(
+            f"diff --git a/{path} b/{path}\n"
+            f"index {index:07x}..{index + 1:07x} 100644\n"
+            f"--- a/{path}\n+++ b/{path}\n"
+        )
+        for h in range(hunks):
+            parts.append(f"@@ -{h * 40 + 1},{lines} +{h * 40 + 1},{lines} @@\n")
+            for line in range(lines):
+                sign = "+" if line % 3 == 0 else "-" if line % 3 == 1 else " "
+                parts.append(f"{sign}value_{index}_{f}_{h}_{line} = <{line}>\n")
+    return "".join(parts)
@@ -1,71 +1,585 @@
 import html
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Protocol, TypeVar
 
+from langchain_core.exceptions import OutputParserException
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+)
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from langchain_core.outputs import Generation as ParserInput
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from pydantic import BaseModel, Field
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, Field, ValidationError
 
-from jj_aidesc.error import AIError
+from jj_aidesc.cache import DescriptionCache
+from jj_aidesc.diff import DiffChunk, diff_paths, digest_diff
+from jj_aidesc.error import AIError, ResponseError
+from jj_aidesc.instrument import tracer
+from jj_aidesc.pipeline import DEFAULT_JOBS
+from jj_aidesc.prompts import (
+    BATCH_INSTRUCTIONS,
+    EXISTING_MESSAGES,
+    EXISTING_WITH_DIFF,
+    SUMMARY_PROMPT,
+)
+from jj_aidesc.scheduler import Scheduler, estimate_tokens, is_retryable
+from jj_aidesc.style_index import StyleIndex
+
+log = logging.getLogger(__name__)
+
+# Called with the description generated so far while a response streams in.
+OnPartial = Callable[[str], None]
+
+
+class ContextCache(Protocol):
+    """System prompts cached on the provider side (see Provider)."""
+
+    def cached_chat_model(self, system_text: str) -> BaseChatModel | None: ...
+
+    def drop_cached_chat_model(self, chat_model: BaseChatModel) -> None: ...
+
+
+T = TypeVar("T")
 
 
 class Description(BaseModel):
     message: str = Field(..., description="The generated commit description")
 
 
+class CommitDescription(BaseModel):
+    change_id: str = Field(..., description="The change_id of the commit")
+    message: str = Field(..., description="The generated commit description")
+
+
+class DescriptionBatch(BaseModel):
+    descriptions: list[CommitDescription] = Field(
+        ..., description="One generated description per commit"
+    )
+
+
+@dataclass
+class Generation:
+    """A generated description and what it cost."""
+
+    message: str
+    cached: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Input tokens the provider read from its prompt cache
+    cached_input_tokens: int = 0
+
+
+def _usage(message: BaseMessage | None) -> tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+def _cache_read(message: BaseMessage | None) -> int:
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    cache_read = details.get("cache_read", 0)
+    if cache_read:
+        tracer.count("prompt cache hits")
+    return cache_read
+
+
+@dataclass
+class _Chains:
+    """Chains of one model for each kind of request."""
+
+    structured: Runnable
+    stream: Runnable
+    batch: Runnable
+
+
 class AI:
+    """Generate descriptions with a chain built once per run.
+
+    The system prompt is rendered once with the language and existing
+    descriptions, which are fixed for a run; only the diff and the
+    conversation history change between calls. With a `style_index`, the
+    existing descriptions are instead chosen for each diff and sent with
+    it, so the system prompt stays the same.
+
+    With a `context_cache`, the system prompt is cached on the provider
+    side on first use and requests only reference it. If the provider
+    cannot cache it, the system prompt is sent with every request as
+    before; a request failing on the cache is sent with the system prompt
+    and the cache is uploaded again for the next one, unless it failed
+    before serving any request.
+    """
+
     def __init__(
         self,
         model: BaseChatModel,
         system_prompt: tuple[str, str],
         language: str = "English",
+        existing_descriptions: list[str] | None = None,
+        cache: DescriptionCache | None = None,
+        scheduler: Scheduler | None = None,
+        style_index: StyleIndex | None = None,
+        context_cache: ContextCache | None = None,
     ):
         self.model = model
         self.system_prompt = system_prompt
         self.language = language
+        self.existing_descriptions = existing_descriptions
+        self.cache = cache
+        self.scheduler = scheduler or Scheduler()
+        self.style_index = style_index
+        self.context_cache = context_cache
         self.conversation_history: list[BaseMessage] = []
 
+        role, template = system_prompt
+        system_message = ChatPromptTemplate.from_messages([(role, template)])
+        rendered_system = system_message.format_messages(
+            language=language,
+            existing_descriptions=(
+                EXISTING_WITH_DIFF
+                if style_index is not None
+                else html.escape("\n\n".join(existing_descriptions or []))
+            ),
+        )
+        self._system_text = "".join(str(m.content) for m in rendered_system)
+
+        self._parser = JsonOutputParser(pydantic_object=Description)
+        self._plain = self._build_chains(model, rendered_system)
+        # Chains referencing the cached system prompt, rebuilt whenever the
+        # provider hands out a new cache, e.g. after the last one expired
+        self._cached: _Chains | None = None
+        self._cached_model: BaseChatModel | None = None
+        self._cache_used = False
+        self._cache_disabled = context_cache is None
+        self._cache_lock = threading.Lock()
+
+    def _build_chains(
+        self,
+        model: BaseChatModel,
+        system: list[BaseMessage],
+        method: str | None = None,
+    ) -> _Chains:
+        structured_options: dict[str, Any] = {"include_raw": True}
+        if method is not None:
+            structured_options["method"] = method
+
+        prompt_template = ChatPromptTemplate.from_messages(
+            [
+                *system,
+                ("human", "{examples}<diff>\n{diff}\n</diff>"),
+                MessagesPlaceholder("history"),
+            ]
+        )
+        stream_template = ChatPromptTemplate.from_messages(
+            [
+                *system,
+                (
+                    "human",
+                    "{examples}<diff>\n{diff}\n</diff>\n\n{format_instructions}",
+                ),
+                MessagesPlaceholder("history"),
+            ]
+        ).partial(format_instructions=self._parser.get_format_instructions())
+        batch_template = ChatPromptTemplate.from_messages(
+            [*system, ("human", "{examples}" + BATCH_INSTRUCTIONS)]
+        )
+        return _Chains(
+            structured=prompt_template
+            | model.with_structured_output(Description, **structured_options),
+            stream=stream_template | model,
+            batch=batch_template
+            | model.with_structured_output(DescriptionBatch, **structured_options),
+        )
+
+    def _chains(self) -> _Chains:
+        if self._cache_disabled:
+            return self._plain
+        assert self.context_cache is not None
+        cached_model = self.context_cache.cached_chat_model(self._system_text)
+        if cached_model is None:
+            return self._plain
+        with self._cache_lock:
+            if self._cached is None or cached_model is not self._cached_model:
+                # Cached prompts cannot be combined with tool definitions,
+                # so structured output is requested as a JSON schema
+                self._cached = self._build_chains(
+                    cached_model, [], method="json_schema"
+                )
+                self._cached_model = cached_model
+                self._cache_used = False
+            return self._cached
+
+    def _call(self, request: Callable[[_Chains], T]) -> T:
+        """Run a request on the cached chains, falling back to the plain ones."""
+        chains = self._chains()
+        if chains is self._plain:
+            return request(chains)
+        cached_model = self._cached_model
+        try:
+            result = request(chains)
+        except (AIError, OutputParserException, ValidationError):
+            # The reply was unusable, which says nothing about the cache
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                raise
+            log.info(f"Context cache failed, sending the system prompt instead: {e}")
+            tracer.count("context cache fallbacks")
+            assert self.context_cache is not None and cached_model is not None
+            self.context_cache.drop_cached_chat_model(cached_model)
+            with self._cache_lock:
+                if chains is self._cached and not self._cache_used:
+                    # Failing right away: the model cannot use the cache
+                    self._cache_disabled = True
+            return request(self._plain)
+        with self._cache_lock:
+            if chains is self._cached:
+                self._cache_used = True
+        return result
+
     def reset_history(self) -> None:
         self.conversation_history = []
 
+    def start_history(self, description: str) -> None:
+        """Start a new conversation from a description generated elsewhere."""
+        self.conversation_history = [AIMessage(content=description)]
+
     def generate(
         self,
         diff: str,
-        existing_descriptions: list[str] | None = None,
         feedback: str | None = None,
+        on_partial: OnPartial | None = None,
     ) -> str:
+        """Generate a description, or revise the last one given `feedback`.
+
+        A revision sends only a digest of the diff, the last description and
+        the feedback; earlier rounds are already reflected in that description.
+        """
+        history: list[BaseMessage] = []
+        if feedback:
+            history = [*self.conversation_history[-1:], HumanMessage(content=feedback)]
+            diff = digest_diff(diff)
+
+        message = self._invoke(diff, history, on_partial).message
+
+        # Keep the response as the draft for potential future regeneration
+        self.conversation_history = [AIMessage(content=message)]
+
+        return message
+
+    def generate_detached(
+        self,
+        diff: str,
+        on_partial: OnPartial | None = None,
+    ) -> Generation:
+        """Generate a description without touching the conversation history.
+
+        Results are served from and stored in the cache when one is set.
+        Safe to call from worker threads.
+        """
+        if self.cache:
+            cached = self.cache.get(self._cache_key(diff))
+            if cached:
+                tracer.count("cache hits")
+                return Generation(message=cached, cached=True)
+
+        generation = self._invoke(diff, [], on_partial)
+
+        if self.cache:
+            self.cache.put(self._cache_key(diff), generation.message)
+
+        return generation
+
+    def generate_batch(self, diffs: dict[str, str]) -> dict[str, Generation]:
+        """Generate descriptions for several commits, keyed by change ID.
+
+        Cached descriptions are reused; the rest are described together in
+        one request, which sends the system prompt only once. Commits the
+        model leaves out, or all of them if its reply cannot be parsed, are
+        generated on their own. Safe to call from worker threads.
+        """
+        generations: dict[str, Generation] = {}
+        pending: dict[str, str] = {}
+        for change_id, diff in diffs.items():
+            cached = self.cache.get(self._cache_key(diff)) if self.cache else None
+            if cached:
+                tracer.count("cache hits")
+                generations[change_id] = Generation(message=cached, cached=True)
+            else:
+                pending[change_id] = diff
+
+        if len(pending) > 1:
+            try:
+                batch = self._invoke_batch(pending)
+            except ResponseError as e:
+                log.info(f"Describing the batch one by one: {e}")
+                tracer.count("unparsable batches")
+                batch = {}
+            for change_id, generation in batch.items():
+                generations[change_id] = generation
+                if self.cache:
+                    self.cache.put(
+                        self._cache_key(pending[change_id]), generation.message
+                    )
+
+        for change_id, diff in pending.items():
+            if change_id not in generations:
+                generations[change_id] = self.generate_detached(diff)
+
+        return generations
+
+    def _invoke_batch(self, diffs: dict[str, str]) -> dict[str, Generation]:
+        commits = "".join(
+            f'<commit change_id="{change_id}">\n<diff>\n{html.escape(diff)}\n'
+            f"</diff>\n</commit>\n"
+            for change_id, diff in diffs.items()
+        )
+        # Chosen for the batch as a whole, which is what the model receives
+        examples = self._examples("".join(diffs.values()))
+        estimated_tokens = estimate_tokens(self._system_text, examples, commits)
         try:
-            # Add feedback to history if provided (regeneration case)
-            if feedback:
-                self.conversation_history.append(HumanMessage(content=feedback))
-
-            prompt_template = ChatPromptTemplate.from_messages(
-                [
-                    self.system_prompt,
-                    (
-                        "human",
-                        "<diff>\n{diff}\n</diff>",
-                    ),
-                    MessagesPlaceholder("history"),
-                ]
+            with tracer.span(
+                "generate batch", "model", diff_chars=len(commits), commits=len(diffs)
+            ) as span:
+                result: dict = self._call(
+                    lambda chains: self.scheduler.call(
+                        lambda: chains.batch.invoke(
+                            {"commits": commits, "examples": examples}
+                        ),
+                        estimated_tokens,
+                    )
+                )
+                input_tokens, output_tokens = _usage(result["raw"])
+                cached_input_tokens = _cache_read(result["raw"])
+                self.scheduler.record_usage(
+                    estimated_tokens, input_tokens + output_tokens
+                )
+                span["input_tokens"] = input_tokens
+                span["output_tokens"] = output_tokens
+                span["cached_input_tokens"] = cached_input_tokens
+        except Exception as e:
+            raise AIError(f"AI generation failed: {e}") from e
+
+        if result["parsed"] is None:
+            raise ResponseError(
+                f"AI returned invalid descriptions: {result['parsing_error']}"
+            )
+        messages = {
+            description.change_id: description.message
+            for description in result["parsed"].descriptions
+            if description.change_id in diffs
+        }
+        # Usage is reported per request; attribute it evenly to its commits
+        count = max(len(messages), 1)
+        return {
+            change_id: Generation(
+                message=message,
+                input_tokens=input_tokens // count,
+                output_tokens=output_tokens // count,
+                cached_input_tokens=cached_input_tokens // count,
             )
+            for change_id, message in messages.items()
+        }
 
-            chain = prompt_template | self.model.with_structured_output(Description)
+    def _invoke(
+        self,
+        diff: str,
+        history: list[BaseMessage],
+        on_partial: OnPartial | None = None,
+    ) -> Generation:
+        inputs = {
+            "diff": html.escape(diff),
+            "history": history,
+            "examples": self._examples(diff),
+        }
+        estimated_tokens = estimate_tokens(
+            self._system_text,
+            inputs["examples"],
+            inputs["diff"],
+            *(str(message.content) for message in history),
+        )
+        try:
+            with tracer.span(
+                "generate",
+                "model",
+                diff_chars=len(inputs["diff"]),
+                history_messages=len(history),
+                streamed=on_partial is not None,
+            ) as span:
+                if on_partial is not None:
+                    generation = self._call(
+                        lambda chains: self.scheduler.call(
+                            lambda: self._stream(chains, inputs, on_partial),
+                            estimated_tokens,
+                        )
+                    )
+                else:
+                    generation = self._call(
+                        lambda chains: self.scheduler.call(
+                            lambda: self._structured(chains, inputs),
+                            estimated_tokens,
+                        )
+                    )
+                self.scheduler.record_usage(
+                    estimated_tokens, generation.input_tokens + generation.output_tokens
+                )
+                span["input_tokens"] = generation.input_tokens
+                span["output_tokens"] = generation.output_tokens
+                span["cached_input_tokens"] = generation.cached_input_tokens
+            return generation
 
-            result: Description = chain.invoke(
-                {
-                    "diff": html.escape(diff),
-                    "existing_descriptions": html.escape(
-                        "\n\n".join(existing_descriptions or [])
-                    ),
-                    "language": self.language,
-                    "history": self.conversation_history,
-                }
-            )  # type: ignore
+        except AIError:
+            raise
+        except Exception as e:
+            raise AIError(f"AI generation failed: {e}") from e
+
+    def _examples(self, diff: str) -> str:
+        """Existing descriptions relevant to a diff, when chosen per diff."""
+        if self.style_index is None:
+            return ""
+        messages = self.style_index.select(diff_paths(diff))
+        return EXISTING_MESSAGES.format(messages=html.escape("\n\n".join(messages)))
+
+    def _cache_key(self, diff: str) -> str:
+        # Descriptions depend on the examples sent along with the diff
+        return self._examples(diff) + diff
+
+    def _structured(self, chains: _Chains, inputs: dict) -> Generation:
+        result: dict = chains.structured.invoke(inputs)  # type: ignore
+        if result["parsed"] is None:
+            raise AIError(
+                f"AI returned an invalid description: {result['parsing_error']}"
+            )
 
-            # Add the AI response to history for potential future regeneration
-            self.conversation_history.append(AIMessage(content=result.message))
+        input_tokens, output_tokens = _usage(result["raw"])
+        return Generation(
+            message=result["parsed"].message,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_input_tokens=_cache_read(result["raw"]),
+        )
 
-            return result.message
+    def _stream(
+        self, chains: _Chains, inputs: dict, on_partial: OnPartial
+    ) -> Generation:
+        """Stream the response as JSON, reporting the partial message as it grows.
 
+        Structured output via tool calls arrives in one piece, so the model is
+        asked for JSON instead; the final object is validated as Description.
+        """
+        # Chunks are accumulated rather than piped through the parser so the
+        # usage metadata on the final chunk is kept.
+        response: AIMessageChunk | None = None
+        chunk: AIMessageChunk
+        partial = None
+        for chunk in chains.stream.stream(inputs):
+            response = chunk if response is None else response + chunk
+            # Content may be a list of blocks, e.g. text with a thought
+            # signature; the text of all of them is the JSON so far
+            partial = self._parser.parse_result(
+                [ParserInput(text=response.text)], partial=True
+            )
+            if isinstance(partial, dict) and partial.get("message"):
+                on_partial(partial["message"])
+        if response is None:
+            raise AIError("AI returned an empty response")
+
+        try:
+            description = Description.model_validate(partial)
+        except ValidationError as e:
+            raise AIError(f"AI returned an invalid description: {e}") from e
+
+        input_tokens, output_tokens = _usage(response)
+        return Generation(
+            message=description.message,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_input_tokens=_cache_read(response),
+        )
+
+
+class Summarizer:
+    """Reduce a diff too large for one request to summaries of its parts.
+
+    Chunks are summarized in parallel (map); if the summaries together are
+    still over budget, they are grouped and summarized again. The result
+    replaces the diff in the final request, which applies the selected style
+    (reduce).
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        max_chars: int,
+        jobs: int = DEFAULT_JOBS,
+        scheduler: Scheduler | None = None,
+    ):
+        self.model = model
+        self.max_chars = max_chars
+        self.jobs = jobs
+        self.scheduler = scheduler or Scheduler()
+        prompt_template = ChatPromptTemplate.from_messages(
+            [SUMMARY_PROMPT, ("human", "<diff>\n{diff}\n</diff>")]
+        )
+        self._chain = prompt_template | model
+
+    def summarize(self, chunks: list[DiffChunk]) -> str:
+        with tracer.span("summarize", "model", chunks=len(chunks)) as span:
+            parts = self._map(chunks)
+            levels = 1
+            while len(parts) > 1 and sum(len(part) for part in parts) > self.max_chars:
+                parts = self._map(self._group(parts))
+                levels += 1
+            span["levels"] = levels
+
+        return (
+            "# The diff is too large to include; summaries of its parts follow.\n"
+            + "".join(parts)
+        )
+
+    def _group(self, parts: list[str]) -> list[DiffChunk]:
+        """Pack summaries into chunks of at most max_chars for the next level."""
+        groups: list[DiffChunk] = []
+        for part in parts:
+            if groups and len(groups[-1].text) + len(part) <= self.max_chars:
+                groups[-1].text += part
+            else:
+                groups.append(DiffChunk(paths=[], text=part))
+        # Always make progress, even if single summaries do not fit together
+        if len(groups) == len(parts):
+            groups = [
+                DiffChunk(paths=[], text="".join(parts[i : i + 2]))
+                for i in range(0, len(parts), 2)
+            ]
+        return groups
+
+    def _map(self, chunks: list[DiffChunk]) -> list[str]:
+        with ThreadPoolExecutor(
+            max_workers=self.jobs, thread_name_prefix="jj-aidesc-summarize"
+        ) as executor:
+            return list(executor.map(self._summarize_chunk, chunks))
+
+    def _summarize_chunk(self, chunk: DiffChunk) -> str:
+        inputs = {"diff": html.escape(chunk.text)}
+        estimated_tokens = estimate_tokens(SUMMARY_PROMPT[1], inputs["diff"])
+        try:
+            message = self.scheduler.call(
+                lambda: self._chain.invoke(inputs), estimated_tokens
+            )
         except Exception as e:
-            raise AIError(f"AI generation failed: {e}") from e
+            raise AIError(f"AI summarization failed: {e}") from e
+        input_tokens, output_tokens = _usage(message)
+        self.scheduler.record_usage(estimated_tokens, input_tokens + output_tokens)
+        tracer.count("summarized chunks")
+
+        summary = StrOutputParser().invoke(message).strip()
+        heading = f"# {', '.join(chunk.paths)}\n" if chunk.paths else ""
+        return f"{heading}{summary}\n\n"
@@ -0,0 +1,93 @@
+"""On-disk cache of generated descriptions."""
+
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+from jj_aidesc.storage import write_json
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "aidesc-cache"
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalize_diff(diff: str) -> str:
+    """Normalize line endings and trailing whitespace so equal diffs hash equally."""
+    lines = diff.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+class DescriptionCache:
+    """Content-addressed store of descriptions keyed by diff and generation settings.
+
+    Entries are one JSON file per key. Reads refresh the file's mtime and the
+    oldest entries are evicted once more than ``max_entries`` are stored.
+    Any I/O failure is logged and treated as a cache miss.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        model: str,
+        temperature: float,
+        style: str,
+        language: str,
+        system_prompt: tuple[str, str],
+        existing_descriptions: list[str] | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self._namespace = json.dumps(
+            [
+                model,
+                temperature,
+                style,
+                language,
+                list(system_prompt),
+                existing_descriptions or [],
+            ]
+        )
+        self._lock = threading.Lock()
+
+    def key(self, diff: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self._namespace, normalize_diff(diff)):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, diff: str) -> str | None:
+        entry = self.path / f"{self.key(diff)}.json"
+        try:
+            data = json.loads(entry.read_text())
+            entry.touch()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable cache entry {entry}: {e}")
+            return None
+        return data.get("message")
+
+    def put(self, diff: str, description: str) -> None:
+        entry = self.path / f"{self.key(diff)}.json"
+        if not write_json(entry, {"message": description}, "cache entry"):
+            return
+        try:
+            self._evict()
+        except OSError as e:
+            log.warning(f"Failed to evict cache entries in {self.path}: {e}")
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = list(self.path.glob("*.json"))
+            excess = len(entries) - self.max_entries
+            if excess <= 0:
+                return
+            entries.sort(key=lambda p: p.stat().st_mtime)
+            for entry in entries[:excess]:
+                entry.unlink(missing_ok=True)
@@ -1,20 +1,52 @@
+import json
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import TYPE_CHECKING, TextIO
 
 import click
-import readchar
 from rich.console import Console
+from rich.live import Live
 from rich.padding import Padding
+from rich.table import Table
+from rich.text import Text
 
 from jj_aidesc import __version__
-from jj_aidesc.ai import AI
+from jj_aidesc.cache import CACHE_DIR_NAME, DescriptionCache
 from jj_aidesc.config import CONFIG_TEMPLATE, Config
+from jj_aidesc.diff import (
+    DEFAULT_FOCUS_FILES,
+    FOCUSED_CONTEXT_LINES,
+    compact_diff,
+    focus_diff,
+)
 from jj_aidesc.editor import Editor
-from jj_aidesc.error import AbortError, error_handle
-from jj_aidesc.jj import JJClient
+from jj_aidesc.error import (
+    AbortError,
+    ConfigError,
+    InputError,
+    JJAIDescError,
+    error_handle,
+)
+from jj_aidesc.instrument import tracer
+from jj_aidesc.jj import Commit, JJClient
+from jj_aidesc.journal import JOURNAL_FILE_NAME, Journal
 from jj_aidesc.logging import setup_logging
+from jj_aidesc.pipeline import DEFAULT_JOBS, DEFAULT_PREFETCH, Generated, Pipeline
 from jj_aidesc.prompts import PROMPTS, PROMPTS_DESCRIPTION
-from jj_aidesc.provider import get_provider
+from jj_aidesc.provider import Provider, get_provider, warm_up
+from jj_aidesc.repos import discover_repos
+from jj_aidesc.routing import Router
+from jj_aidesc.scheduler import CHARS_PER_TOKEN, Scheduler
 from jj_aidesc.spinner import get_spinner
+from jj_aidesc.style_index import STYLE_INDEX_FILE_NAME, StyleIndex
+from jj_aidesc.watch import DEFAULT_INTERVAL, Watcher
+
+if TYPE_CHECKING:
+    # Deferred at runtime: langchain is only needed once generation starts
+    from jj_aidesc.ai import AI, OnPartial, Summarizer
 
 console = Console(highlight=False)
 
@@ -40,6 +72,12 @@ console = Console(highlight=False)
     type=float,
     help="Temperature for AI generation (default: 0.0)",
 )
+@click.option(
+    "--provider",
+    "provider_name",
+    type=click.Choice(["google-genai", "openai-compatible"]),
+    help="Default provider (default: google-genai)",
+)
 @click.option(
     "--api-key",
     type=str,
@@ -70,6 +108,11 @@ console = Console(highlight=False)
     is_flag=True,
     help="Apply all descriptions without confirmation",
 )
+@click.option(
+    "--batch-apply",
+    is_flag=True,
+    help="Apply accepted descriptions together in one jj operation at the end",
+)
 @click.option(
     "--dry-run",
     "-n",
@@ -82,6 +125,12 @@ console = Console(highlight=False)
     default="mutable()",
     help="Target revset (default: mutable())",
 )
+@click.option(
+    "--repos",
+    "repos_spec",
+    help="Describe the repositories matching a glob (e.g. 'work/*') or listed "
+    "in a file, with --apply, --dry-run or --format jsonl",
+)
 @click.option(
     "--revise",
     "--include-described",
@@ -90,78 +139,218 @@ console = Console(highlight=False)
     default=False,
     help="Include revisions for targets that already have descriptions",
 )
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    help=f"Number of descriptions generated in parallel (default: {DEFAULT_JOBS})",
+)
+@click.option(
+    "--prefetch",
+    type=click.IntRange(min=0),
+    default=DEFAULT_PREFETCH,
+    help="Number of commits generated ahead of the one under review "
+    f"(default: {DEFAULT_PREFETCH})",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Describe up to this many consecutive commits per model request, "
+    "within --max-diff-chars (default: 1)",
+)
+@click.option(
+    "--max-diff-chars",
+    type=click.IntRange(min=0),
+    help="Maximum diff size in characters sent to the model, 0 for no limit "
+    "(default: 100000)",
+)
+@click.option(
+    "--focus-files",
+    type=click.IntRange(min=0),
+    help="Send change stats for every file but hunks only for this many of the "
+    "most significant ones (default: full diffs)",
+)
+@click.option(
+    "--map-reduce",
+    is_flag=True,
+    default=None,
+    help="Summarize the parts of diffs over --max-diff-chars in parallel "
+    "instead of truncating them",
+)
+@click.option(
+    "--rpm",
+    "requests_per_minute",
+    type=click.IntRange(min=1),
+    help="Requests per minute allowed by the API quota (default: no limit)",
+)
+@click.option(
+    "--tpm",
+    "tokens_per_minute",
+    type=click.IntRange(min=1),
+    help="Tokens per minute allowed by the API quota (default: no limit)",
+)
+@click.option(
+    "--stream/--no-stream",
+    default=True,
+    help="Show descriptions as they are generated (default: enabled)",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Always call the model instead of reusing cached descriptions",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the previous run, reusing its descriptions and review decisions",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "jsonl"]),
+    default="text",
+    help="Output format; jsonl prints one JSON record per commit without "
+    "applying (default: text)",
+)
+@click.option(
+    "--from-jsonl",
+    type=click.File("r"),
+    help="Apply descriptions from JSONL records (e.g. reviewed --format jsonl "
+    "output, '-' for stdin) without calling the model",
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Show time spent in jj, the model and applying, and token usage",
+)
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write timing spans in Chrome trace format (chrome://tracing, Perfetto)",
+)
 @error_handle
 def main(
     ctx: click.Context,
     verbose: bool,
     model: str | None,
     temperature: float | None,
+    provider_name: str | None,
     api_key: str | None,
     config_path: str | None,
     language: str | None,
     style: str | None,
     apply: bool,
+    batch_apply: bool,
     dry_run: bool,
     revisions: str,
+    repos_spec: str | None,
     include_described: bool,
+    jobs: int,
+    prefetch: int,
+    batch_size: int,
+    max_diff_chars: int | None,
+    focus_files: int | None,
+    map_reduce: bool | None,
+    requests_per_minute: int | None,
+    tokens_per_minute: int | None,
+    stream: bool,
+    no_cache: bool,
+    resume: bool,
+    output_format: str,
+    from_jsonl: TextIO | None,
+    stats: bool,
+    trace_file: str | None,
 ) -> None:
     """Generate AI-powered descriptions for jj commits without description."""
     if ctx.invoked_subcommand is not None:
         return
 
-    setup_logging(verbose)
-    Spinner = get_spinner(verbose)
-
-    # Initialize JJ client and check repository
-    jj = JJClient()
-    if not jj.check_jj_available():
-        console.print("[bold red]Error:[/bold red] jj is not installed or not in PATH")
-        raise SystemExit(1)
-
-    if not jj.is_in_repo():
-        console.print("[bold red]Error:[/bold red] Not in a jj repository")
-        raise SystemExit(1)
+    jsonl = output_format == "jsonl"
 
-    # Initialize configuration
-    config = Config(
-        _model=model,
-        _temperature=temperature,
-        _api_key=api_key,
-        _config_path=config_path,
-        _language=language,
-        _style=style,
-    )
+    setup_logging(verbose)
+    # In jsonl mode stdout carries records only, so progress goes to the log
+    Spinner = get_spinner(verbose or jsonl)
+    # Live previews would interleave with verbose log output
+    stream = stream and not verbose and not jsonl
 
-    # Get provider and AI
-    provider = get_provider(config)
+    if stats or trace_file:
+        tracer.enable()
+        # Report when the command ends, including early returns and errors
+        ctx.call_on_close(lambda: _report_trace(stats, trace_file, jsonl))
 
-    # Get existing descriptions for 'follow' style
-    existing_descriptions: list[str] | None = None
-    if config.style == "follow":
-        existing_descriptions = jj.get_existing_descriptions(revisions)
+    # Initialize JJ client and check repository; neither --repos nor
+    # --from-jsonl needs the current directory to be a repository
+    jj = JJClient(reuse_snapshot=True)
+    _check_jj(jj, in_repo=repos_spec is None and from_jsonl is None)
 
-    # Get system prompt
-    system_prompt = PROMPTS[config.style]
+    if repos_spec is not None:
+        _describe_repos(ctx.params, repos_spec, Spinner)
+        return
+    if from_jsonl is not None:
+        _apply_jsonl(jj, from_jsonl, Spinner)
+        return
 
-    ai = AI(
-        model=provider.chat_model,
-        system_prompt=system_prompt,
-        language=config.language,
-    )
+    # Initialize configuration
+    config = _load_config(ctx.params, jj)
 
-    editor = Editor()
+    provider, route_providers = _create_providers(config)
 
     # Display configuration
-    _display_config(config, provider)
+    if not jsonl:
+        _display_config(config, provider, route_providers)
 
     # Find commits without description
     with Spinner(text="Scanning for commits without description...") as spinner:
-        commits = jj.get_commits_without_description(revisions, include_described)
+        commits = jj.get_commits_without_description(
+            revisions,
+            include_described,
+            with_diff=True,
+            context=_diff_context(config),
+        )
         if not commits:
             spinner.succeed("No commits without description found")
             return
         spinner.succeed(f"Found {len(commits)} commit(s)")
 
+    # One scheduler per provider, shared by all workers, so parallel
+    # generation stays within each provider's quota
+    schedulers = _create_schedulers(config, [provider, *route_providers])
+
+    # Cache generated descriptions inside the repository's .jj directory
+    cache_path = None if no_cache else jj.get_root() / ".jj" / CACHE_DIR_NAME
+
+    ai = _create_generator(
+        jj, config, provider, route_providers, schedulers, cache_path
+    )
+
+    summarizer = _create_summarizer(config, provider, schedulers, jobs)
+
+    if jsonl:
+        with Pipeline(
+            jj,
+            ai,
+            jobs,
+            config.max_diff_chars,
+            summarizer=summarizer,
+            batch_size=batch_size,
+            focus_files=config.focus_files,
+        ) as pipeline:
+            pipeline.submit(list(reversed(commits)))
+            _emit_jsonl(pipeline)
+        return
+
+    editor = Editor()
+
+    # Progress is journaled so that an interrupted review can be resumed
+    journal = Journal(jj.get_root() / ".jj" / JOURNAL_FILE_NAME, resume=resume)
+    if resume and journal.entries:
+        console.print(
+            f"[dim]Resuming from a previous run "
+            f"({len(journal.entries)} commit(s) journaled)[/dim]"
+        )
+
     console.print()
     for i, commit in enumerate(reversed(commits), 1):  # Oldest first
         files_display = ", ".join(commit.files[:3])
@@ -171,43 +360,84 @@ def main(
 
     console.print()
 
-    # Generate descriptions
+    # Accepted descriptions are collected here instead of applied one by one
+    pending: list[tuple[Commit, str]] | None = [] if batch_apply else None
+
+    # Generate descriptions ahead of the review, which stays oldest first
     applied_count = 0
-    quit_requested = False
-    for i, commit in enumerate(reversed(commits), 1):  # Oldest first
-        if quit_requested:
-            break
-
-        console.print(f"[bold][{i}/{len(commits)}] {commit.change_id}[/bold]")
-
-        # Reset AI conversation history for each new commit
-        ai.reset_history()
-
-        # Get diff
-        with Spinner(text="  Getting diff...") as spinner:
-            diff = jj.get_diff(commit.change_id)
-            spinner.succeed("  Got diff")
-
-        # Generation loop (supports regeneration with feedback)
-        description = _generation_loop(
-            ai=ai,
-            diff=diff,
-            existing_descriptions=existing_descriptions,
-            jj=jj,
-            editor=editor,
-            commit=commit,
-            dry_run=dry_run,
-            apply=apply,
-            Spinner=Spinner,
-        )
+    # Without review pauses there is nothing to speculate on: generate everything
+    lookahead = None if apply or dry_run else prefetch
+    with Pipeline(
+        jj,
+        ai,
+        jobs,
+        config.max_diff_chars,
+        journal,
+        summarizer,
+        lookahead,
+        batch_size,
+        config.focus_files,
+        stream=stream,
+    ) as pipeline:
+        pipeline.submit(list(reversed(commits)))
+
+        for i, (commit, future) in enumerate(pipeline.results(), 1):
+            console.print(f"[bold][{i}/{len(commits)}] {commit.change_id}[/bold]")
+
+            if stream:
+                with _stream_preview("  Generating description...") as on_partial:
+                    generated = pipeline.take(commit, future, on_partial)
+                _print_succeed(_generated_text(generated))
+            else:
+                with Spinner(text="  Generating description...") as spinner:
+                    generated = pipeline.take(commit, future)
+                    spinner.succeed(_generated_text(generated))
+
+            # Decisions made in the resumed run are not asked again
+            if generated.resumed == "skipped":
+                console.print("  [yellow]Skipped (previous run)[/yellow]")
+                console.print()
+                continue
+            if generated.resumed in ("accepted", "edited") and not dry_run:
+                status = _apply_description(jj, commit, generated.description, pending)
+                console.print(f"  [green]✓ {status} (previous run)[/green]")
+                console.print()
+                applied_count += 1
+                continue
+
+            # Regeneration continues the conversation from the prefetched result
+            ai.start_history(generated.description)
 
-        if description is None:
-            # Quit was requested
-            quit_requested = True
-            console.print("  [yellow]Quit[/yellow]")
-        elif description:
-            applied_count += 1
+            # Review loop (supports regeneration with feedback)
+            description = _generation_loop(
+                ai=ai,
+                diff=generated.diff,
+                description=generated.description,
+                jj=jj,
+                editor=editor,
+                commit=commit,
+                dry_run=dry_run,
+                apply=apply,
+                pending=pending,
+                stream=stream,
+                Spinner=Spinner,
+                journal=journal,
+            )
+
+            if description is None:
+                # Quit was requested
+                console.print("  [yellow]Quit[/yellow]")
+                console.print()
+                break
+            elif description:
+                applied_count += 1
 
+            console.print()
+
+    if pending:
+        with Spinner(text=f"Applying {len(pending)} description(s)...") as spinner:
+            jj.set_descriptions(pending)
+            spinner.succeed(f"Applied {len(pending)} description(s)")
         console.print()
 
     # Summary
@@ -250,7 +480,464 @@ def init(config_path: str, force: bool) -> None:
     console.print(f"[green]Created:[/green] {config_path}")
 
 
-def _display_config(config: Config, provider) -> None:
+@main.command()
+@click.help_option("-h", "--help")
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.1),
+    default=DEFAULT_INTERVAL,
+    help=f"Seconds between checks for new operations (default: {DEFAULT_INTERVAL})",
+)
+@click.pass_context
+@error_handle
+def watch(ctx: click.Context, interval: float) -> None:
+    """Pre-generate descriptions for new commits as they appear.
+
+    Descriptions go to the cache, so a later jj-aidesc run only reviews
+    them. Options such as --style or --revisions are given before `watch`.
+    """
+    assert ctx.parent is not None
+    params = ctx.parent.params
+    setup_logging(params["verbose"])
+    if params["no_cache"]:
+        raise ConfigError("watch stores descriptions in the cache; drop --no-cache")
+
+    # Never snapshot: the working copy is picked up by the user's own jj commands
+    jj = JJClient(ignore_working_copy=True)
+    _check_jj(jj)
+
+    config = _load_config(params, jj)
+    provider, route_providers = _create_providers(config)
+    _display_config(config, provider, route_providers)
+
+    schedulers = _create_schedulers(config, [provider, *route_providers])
+    cache_path = jj.get_root() / ".jj" / CACHE_DIR_NAME
+    summarizer = _create_summarizer(config, provider, schedulers, params["jobs"])
+
+    watcher = Watcher(
+        jj,
+        params["revisions"],
+        params["include_described"],
+        context=_diff_context(config),
+    )
+    console.print("[dim]Watching for new commits (Ctrl-C to stop)...[/dim]")
+    try:
+        while True:
+            commits: list[Commit] = []
+            try:
+                commits = watcher.poll()
+                if commits:
+                    # Recreated per batch so 'follow' sees the latest
+                    # descriptions, as the review run will
+                    ai = _create_generator(
+                        jj,
+                        config,
+                        provider,
+                        route_providers,
+                        schedulers,
+                        cache_path,
+                    )
+                    with Pipeline(
+                        jj,
+                        ai,
+                        params["jobs"],
+                        config.max_diff_chars,
+                        summarizer=summarizer,
+                        batch_size=params["batch_size"],
+                        focus_files=config.focus_files,
+                    ) as pipeline:
+                        pipeline.submit(commits)
+                        _, failed = _report_generated(pipeline)
+                    if failed:
+                        # Reported again by the next poll, to be retried
+                        watcher.reset(failed)
+            except JJAIDescError as e:
+                # A failed jj command (e.g. racing the user's own) must not
+                # stop the watch; the next poll rescans
+                console.print(f"[bold red]Error:[/bold red] {e}")
+                watcher.reset(commits)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        console.print(f"[dim]Stopped ({len(watcher.seen)} commit(s) seen)[/dim]")
+
+
+@main.command()
+@click.help_option("-h", "--help")
+@click.option(
+    "--generate",
+    is_flag=True,
+    help="Also describe every commit from both diffs, to compare the results",
+)
+@click.pass_context
+@error_handle
+def compare(ctx: click.Context, generate: bool) -> None:
+    """Compare the prompt size of full diffs and the --focus-files view.
+
+    Nothing is applied. Options such as --focus-files or --revisions are
+    given before `compare`.
+    """
+    assert ctx.parent is not None
+    params = ctx.parent.params
+    setup_logging(params["verbose"])
+    Spinner = get_spinner(params["verbose"])
+
+    jj = JJClient(reuse_snapshot=True)
+    _check_jj(jj)
+
+    config = _load_config(params, jj)
+    focus_files = (
+        config.focus_files if config.focus_files is not None else DEFAULT_FOCUS_FILES
+    )
+
+    with Spinner(text="Scanning for commits without description...") as spinner:
+        full = jj.get_commits_without_description(
+            params["revisions"], params["include_described"], with_diff=True
+        )
+        if not full:
+            spinner.succeed("No commits without description found")
+            return
+        focused = jj.get_commits_without_description(
+            params["revisions"],
+            params["include_described"],
+            with_diff=True,
+            context=FOCUSED_CONTEXT_LINES,
+        )
+        spinner.succeed(f"Found {len(full)} commit(s)")
+    full.reverse()  # Oldest first
+    focused.reverse()
+
+    descriptions: dict[str, tuple[Generated, Generated]] = {}
+    if generate:
+        provider, route_providers = _create_providers(config)
+        schedulers = _create_schedulers(config, [provider, *route_providers])
+        cache_path = (
+            None if params["no_cache"] else jj.get_root() / ".jj" / CACHE_DIR_NAME
+        )
+        ai = _create_generator(
+            jj,
+            config,
+            provider,
+            route_providers,
+            schedulers,
+            cache_path,
+        )
+        results: list[dict[str, Generated]] = []
+        with Spinner(text=f"Generating {2 * len(full)} description(s)...") as spinner:
+            for commits, focus in ((full, None), (focused, focus_files)):
+                with Pipeline(
+                    jj,
+                    ai,
+                    params["jobs"],
+                    config.max_diff_chars,
+                    focus_files=focus,
+                ) as pipeline:
+                    pipeline.submit(commits)
+                    results.append(
+                        {
+                            commit.change_id: future.result()
+                            for commit, future in pipeline.completed()
+                        }
+                    )
+            spinner.succeed(f"Generated {2 * len(full)} description(s)")
+        descriptions = {
+            change_id: (generated, results[1][change_id])
+            for change_id, generated in results[0].items()
+        }
+
+    table = Table(box=None, padding=(0, 2))
+    table.add_column("Change")
+    table.add_column("Files", justify="right")
+    table.add_column("Full", justify="right")
+    table.add_column(f"Focused ({focus_files})", justify="right")
+    table.add_column("Saved", justify="right")
+    focused_diffs = {commit.change_id: commit.diff or "" for commit in focused}
+    totals = [0, 0]
+    for commit in full:
+        sizes = [
+            len(compact_diff(commit.diff or "", config.max_diff_chars)),
+            len(
+                compact_diff(
+                    focus_diff(focused_diffs.get(commit.change_id, ""), focus_files),
+                    config.max_diff_chars,
+                )
+            ),
+        ]
+        totals = [total + size for total, size in zip(totals, sizes, strict=True)]
+        table.add_row(
+            commit.change_id, str(len(commit.files)), *_compared_sizes(*sizes)
+        )
+    table.add_row("[bold]Total[/bold]", "", *_compared_sizes(*totals))
+    console.print()
+    console.print(table)
+    console.print("[dim]Sizes in characters (≈tokens) after compaction[/dim]")
+
+    for change_id, pair in descriptions.items():
+        console.print()
+        console.print(f"[bold]{change_id}[/bold]")
+        for label, generated in zip(("Full", "Focused"), pair, strict=True):
+            tokens = f", {generated.input_tokens} input tokens"
+            console.print(
+                f"  [dim]{label}{tokens if generated.input_tokens else ''}:[/dim]"
+            )
+            console.print(Padding(generated.description, (0, 0, 0, 4)))
+
+
+def _compared_sizes(full: int, focused: int) -> list[str]:
+    saved = f"{1 - focused / full:.0%}" if full else "-"
+    return [
+        f"{full} (≈{full // CHARS_PER_TOKEN})",
+        f"{focused} (≈{focused // CHARS_PER_TOKEN})",
+        saved,
+    ]
+
+
+def _diff_context(config: Config) -> int | None:
+    """Context lines of the diffs to fetch, fewer for the focused view."""
+    return FOCUSED_CONTEXT_LINES if config.focus_files is not None else None
+
+
+def _describe_repos(params: dict, spec: str, Spinner) -> None:
+    """Describe the commits of several repositories in one run.
+
+    Repositories are scanned in parallel, and their pipelines share one
+    worker pool and, per provider, one client and rate limit. Settings
+    come from the current directory. There is no interactive review:
+    descriptions are reported, applied with --apply, or written as one
+    JSONL queue to review and apply with --from-jsonl.
+    """
+    jsonl = params["output_format"] == "jsonl"
+    if not (jsonl or params["apply"] or params["dry_run"]):
+        raise ConfigError(
+            "--repos needs --apply, --dry-run or --format jsonl "
+            "(review the records, then apply them with --from-jsonl)"
+        )
+
+    clients = [JJClient(path, reuse_snapshot=True) for path in discover_repos(spec)]
+    config = _load_config(params, None)
+    provider, route_providers = _create_providers(config)
+    if not jsonl:
+        _display_config(config, provider, route_providers)
+
+    def scan(jj: JJClient) -> list[Commit]:
+        return jj.get_commits_without_description(
+            params["revisions"],
+            params["include_described"],
+            with_diff=True,
+            context=_diff_context(config),
+        )
+
+    scanned: list[tuple[JJClient, list[Commit]]] = []
+    failed: list[tuple[JJClient, JJAIDescError]] = []
+    with Spinner(text=f"Scanning {len(clients)} repositories...") as spinner:
+        with ThreadPoolExecutor(
+            max_workers=params["jobs"], thread_name_prefix="jj-aidesc-scan"
+        ) as executor:
+            scans = [executor.submit(scan, jj) for jj in clients]
+        for jj, future in zip(clients, scans, strict=True):
+            try:
+                commits = future.result()
+            except JJAIDescError as e:
+                failed.append((jj, e))
+                continue
+            if commits:
+                scanned.append((jj, commits))
+        total = sum(len(commits) for _, commits in scanned)
+        spinner.succeed(
+            f"Found {total} commit(s) in {len(scanned)} of {len(clients)} repositories"
+        )
+    for jj, error in failed:
+        if jsonl:
+            click.echo(json.dumps({"repo": str(jj.repo_path), "error": str(error)}))
+        else:
+            console.print(f"[bold red]Error:[/bold red] {jj.repo_path}: {error}")
+
+    schedulers = _create_schedulers(config, [provider, *route_providers])
+    summarizer = _create_summarizer(config, provider, schedulers, params["jobs"])
+
+    described = 0
+    with ThreadPoolExecutor(
+        max_workers=params["jobs"], thread_name_prefix="jj-aidesc"
+    ) as executor:
+        pipelines: list[tuple[JJClient, Pipeline]] = []
+        try:
+            # Everything is submitted up front, so all repositories progress
+            # while the first ones are reported
+            for jj, commits in scanned:
+                cache_path = (
+                    None
+                    if params["no_cache"]
+                    else jj.get_root() / ".jj" / CACHE_DIR_NAME
+                )
+                ai = _create_generator(
+                    jj,
+                    config,
+                    provider,
+                    route_providers,
+                    schedulers,
+                    cache_path,
+                )
+                pipeline = Pipeline(
+                    jj,
+                    ai,
+                    params["jobs"],
+                    config.max_diff_chars,
+                    summarizer=summarizer,
+                    batch_size=params["batch_size"],
+                    focus_files=config.focus_files,
+                    executor=executor,
+                )
+                pipeline.submit(list(reversed(commits)))
+                pipelines.append((jj, pipeline))
+
+            for jj, pipeline in pipelines:
+                if jsonl:
+                    _emit_jsonl(pipeline, repo=jj.get_root())
+                    continue
+                console.print(f"[bold]{jj.get_root()}[/bold]")
+                results, _ = _report_generated(pipeline)
+                if params["apply"] and not params["dry_run"] and results:
+                    jj.set_descriptions(results)
+                described += len(results)
+                console.print()
+        finally:
+            for _, pipeline in pipelines:
+                pipeline.shutdown()
+
+    if jsonl:
+        return
+    if params["dry_run"]:
+        console.print(
+            f"[bold]Done![/bold] {described} description(s) generated "
+            f"in {len(scanned)} repositories (dry-run)"
+        )
+    else:
+        console.print(
+            f"[bold]Done![/bold] {described} commit(s) updated "
+            f"in {len(scanned)} repositories."
+        )
+
+
+def _load_config(params: dict, jj: JJClient | None) -> Config:
+    """Build the configuration from the options of the main command."""
+    return Config(
+        _model=params["model"],
+        _temperature=params["temperature"],
+        _api_key=params["api_key"],
+        _config_path=params["config_path"],
+        _language=params["language"],
+        _style=params["style"],
+        _max_diff_chars=params["max_diff_chars"],
+        _map_reduce=params["map_reduce"],
+        _focus_files=params["focus_files"],
+        _requests_per_minute=params["requests_per_minute"],
+        _tokens_per_minute=params["tokens_per_minute"],
+        _provider=params["provider_name"],
+        _jj_root=jj.get_root() if jj else None,
+    )
+
+
+def _check_jj(jj: JJClient, in_repo: bool = True) -> None:
+    """Exit unless jj is installed and, with `in_repo`, run inside a repository."""
+    if not jj.check_jj_available():
+        console.print("[bold red]Error:[/bold red] jj is not installed or not in PATH")
+        raise SystemExit(1)
+    if in_repo and not jj.is_in_repo():
+        console.print("[bold red]Error:[/bold red] Not in a jj repository")
+        raise SystemExit(1)
+
+
+def _create_providers(config: Config) -> tuple[Provider, list[Provider]]:
+    """Create the default provider and those of the routing rules.
+
+    The chat models themselves are created lazily, but the connections are
+    opened in the background right away, e.g. while jj scans.
+    """
+    provider = get_provider(config)
+    route_providers = [
+        get_provider(config, rule.provider, rule.model) for rule in config.routing
+    ]
+    warm_up([provider, *route_providers])
+    return provider, route_providers
+
+
+def _create_schedulers(
+    config: Config, providers: list[Provider]
+) -> dict[str, Scheduler]:
+    return {
+        provider.name: Scheduler(
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            max_retries=config.max_retries,
+        )
+        for provider in providers
+    }
+
+
+def _create_summarizer(
+    config: Config,
+    provider: Provider,
+    schedulers: dict[str, Scheduler],
+    jobs: int,
+) -> "Summarizer | None":
+    """Summarize diffs too large for one request in parts, with --map-reduce."""
+    if not config.map_reduce:
+        return None
+
+    from jj_aidesc.ai import Summarizer
+
+    return Summarizer(
+        model=provider.summary_chat_model,
+        max_chars=config.max_diff_chars,
+        jobs=jobs,
+        scheduler=schedulers[provider.name],
+    )
+
+
+def _create_generator(
+    jj: JJClient,
+    config: Config,
+    provider: Provider,
+    route_providers: list[Provider],
+    schedulers: dict[str, Scheduler],
+    cache_path: Path | None,
+) -> "AI | Router":
+    """Create the AI of the default provider, behind a router if rules are set."""
+    # Index existing descriptions for 'follow' style, catching up with new ones
+    style_index: StyleIndex | None = None
+    if config.style == "follow":
+        style_index = StyleIndex(jj.get_root() / ".jj" / STYLE_INDEX_FILE_NAME)
+        style_index.update(jj)
+
+    # Get system prompt
+    system_prompt = PROMPTS[config.style]
+
+    def create_ai(for_provider: Provider) -> "AI":
+        return _create_ai(
+            for_provider,
+            config,
+            system_prompt,
+            style_index,
+            schedulers[for_provider.name],
+            cache_path,
+        )
+
+    ai = create_ai(provider)
+    if not config.routing:
+        return ai
+    return Router(
+        ai,
+        [
+            (rule, create_ai(route_provider))
+            for rule, route_provider in zip(
+                config.routing, route_providers, strict=True
+            )
+        ],
+    )
+
+
+def _display_config(
+    config: Config, provider: Provider, route_providers: list[Provider]
+) -> None:
     console.print()
     prompt_display = f"{PROMPTS_DESCRIPTION[config.style]} ({config.style})"
     console.print(
@@ -258,45 +945,85 @@ def _display_config(config: Config, provider) -> None:
         f"[dim]Model:[/dim] {provider.model_name}  "
         f"[dim]Temperature:[/dim] {config.temperature}"
     )
+    for rule, route_provider in zip(config.routing, route_providers, strict=True):
+        console.print(
+            f"[dim]Route:[/dim] {rule.describe()} → "
+            f"{route_provider.name} {route_provider.model_name}"
+        )
     console.print(
         f"[dim]Style:[/dim] {prompt_display}  [dim]Language:[/dim] {config.language}"
     )
     console.print()
 
 
+def _create_ai(
+    provider: Provider,
+    config: Config,
+    system_prompt: tuple[str, str],
+    style_index: StyleIndex | None,
+    scheduler: Scheduler,
+    cache_path: Path | None,
+) -> "AI":
+    from jj_aidesc.ai import AI
+
+    cache: DescriptionCache | None = None
+    if cache_path is not None:
+        cache = DescriptionCache(
+            cache_path,
+            model=provider.model_name,
+            temperature=config.temperature,
+            style=config.style,
+            language=config.language,
+            system_prompt=system_prompt,
+        )
+    return AI(
+        model=provider.chat_model,
+        system_prompt=system_prompt,
+        language=config.language,
+        cache=cache,
+        scheduler=scheduler,
+        style_index=style_index,
+        context_cache=provider,
+    )
+
+
 def _generation_loop(
-    ai: AI,
+    ai: "AI | Router",
     diff: str,
-    existing_descriptions: list[str] | None,
+    description: str,
     jj: JJClient,
     editor: Editor,
     commit,
     dry_run: bool,
     apply: bool,
+    pending: list[tuple[Commit, str]] | None,
+    stream: bool,
     Spinner,
+    journal: Journal,
 ) -> bool | None:
     """
-    Generate description with optional regeneration loop.
+    Review a generated description with optional regeneration loop.
 
     Returns:
-        True if description was applied
+        True if description was applied (or queued in pending)
         False if skipped
         None if quit was requested
     """
     feedback: str | None = None
 
     while True:
-        # Generate description
-        if feedback:
+        # Regenerate description
+        if feedback and stream:
+            with _stream_preview("  Regenerating description...") as on_partial:
+                description = ai.generate(diff, feedback, on_partial)
+            _print_succeed("  Regenerated description")
+        elif feedback:
             with Spinner(text="  Regenerating description...") as spinner:
-                description = ai.generate(
-                    diff, existing_descriptions, feedback=feedback
-                )
+                description = ai.generate(diff, feedback=feedback)
                 spinner.succeed("  Regenerated description")
-        else:
-            with Spinner(text="  Generating description...") as spinner:
-                description = ai.generate(diff, existing_descriptions)
-                spinner.succeed("  Generated description")
+        if feedback:
+            journal.record(commit.change_id, "generated", description)
+        feedback = None
 
         # Display description
         console.print("  ────────────────────────────────")
@@ -309,23 +1036,27 @@ def _generation_loop(
 
         if apply:
             # Apply without confirmation
-            jj.set_description(description, commit.change_id)
-            console.print("  [green]✓ Applied[/green]")
+            journal.record(commit.change_id, "accepted", description)
+            status = _apply_description(jj, commit, description, pending)
+            console.print(f"  [green]✓ {status}[/green]")
             return True
 
         # Ask for confirmation
         action = _prompt_action()
         if action == "y":
-            jj.set_description(description, commit.change_id)
-            console.print("  [green]✓ Applied[/green]")
+            journal.record(commit.change_id, "accepted", description)
+            status = _apply_description(jj, commit, description, pending)
+            console.print(f"  [green]✓ {status}[/green]")
             return True
         elif action == "e":
             try:
                 edited = editor.edit(description)
-                jj.set_description(edited, commit.change_id)
-                console.print("  [green]✓ Applied (edited)[/green]")
+                journal.record(commit.change_id, "edited", edited)
+                status = _apply_description(jj, commit, edited, pending)
+                console.print(f"  [green]✓ {status} (edited)[/green]")
                 return True
             except AbortError:
+                journal.record(commit.change_id, "skipped")
                 console.print("  [yellow]Skipped[/yellow]")
                 return False
         elif action == "r":
@@ -335,13 +1066,186 @@ def _generation_loop(
                 continue
             # Loop will continue with regeneration
         elif action == "n":
+            journal.record(commit.change_id, "skipped")
             console.print("  [yellow]Skipped[/yellow]")
             return False
         elif action == "q":
             return None
 
 
+def _report_generated(
+    pipeline: Pipeline,
+) -> tuple[list[tuple[Commit, str]], list[Commit]]:
+    """Print one line per commit as it completes.
+
+    Returns the descriptions and the commits whose generation failed.
+    """
+    descriptions: list[tuple[Commit, str]] = []
+    failed: list[Commit] = []
+    for commit, future in pipeline.completed():
+        try:
+            generated = future.result()
+        except JJAIDescError as e:
+            console.print(f"  [red]✗[/red] {commit.change_id}  {e}")
+            failed.append(commit)
+            continue
+        descriptions.append((commit, generated.description))
+        summary = generated.description.partition("\n")[0]
+        source = "cached" if generated.cached else "generated"
+        console.print(
+            f"  [green]✓[/green] {commit.change_id}  {summary}  [dim]({source})[/dim]"
+        )
+    return descriptions, failed
+
+
+def _emit_jsonl(pipeline: Pipeline, repo: Path | None = None) -> None:
+    """Print one JSON record per commit as soon as its description is ready."""
+    for commit, future in pipeline.completed():
+        record: dict = {"repo": str(repo)} if repo else {}
+        record |= {
+            "change_id": commit.change_id,
+            "commit_id": commit.commit_id,
+            "files": commit.files,
+        }
+        try:
+            generated = future.result()
+        except JJAIDescError as e:
+            record["error"] = str(e)
+        else:
+            record.update(
+                diff_size=generated.diff_size,
+                description=generated.description,
+                cached=generated.cached,
+                latency=round(generated.latency, 3),
+                input_tokens=generated.input_tokens,
+                output_tokens=generated.output_tokens,
+                cached_input_tokens=generated.cached_input_tokens,
+            )
+        click.echo(json.dumps(record, ensure_ascii=False))
+
+
+def _apply_jsonl(jj: JJClient, records: TextIO, Spinner) -> None:
+    """Apply the descriptions of JSONL records in a single jj operation per repo.
+
+    Records with a `repo` (from --repos) are applied to that repository,
+    the others to the current one. Records are keyed on their change ID,
+    the last one for a change winning; the recorded commit ID is ignored,
+    since the commit may have been rewritten since it was generated, and
+    the current one is resolved when applying. Records without a
+    description (e.g. failed generations) are skipped.
+    """
+    by_repo: dict[str | None, dict[str, tuple[Commit, str]]] = {}
+    for line_number, line in enumerate(records, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            change_id = record["change_id"]
+        except (json.JSONDecodeError, TypeError, KeyError) as e:
+            raise InputError(f"Invalid JSONL record on line {line_number}: {e}") from e
+        if not record.get("description"):
+            continue
+        commit = Commit(
+            change_id=change_id,
+            commit_id="",
+            empty=False,
+            files=record.get("files", []),
+        )
+        by_repo.setdefault(record.get("repo"), {})[change_id] = (
+            commit,
+            record["description"],
+        )
+
+    if None in by_repo and not jj.is_in_repo():
+        raise InputError("Records without a repo must be applied in a jj repository")
+
+    for repo, descriptions in by_repo.items():
+        repo_jj = jj if repo is None else JJClient(Path(repo))
+        where = f" in {repo}" if repo else ""
+        with Spinner(
+            text=f"Applying {len(descriptions)} description(s){where}..."
+        ) as spinner:
+            repo_jj.set_descriptions(list(descriptions.values()))
+            spinner.succeed(f"Applied {len(descriptions)} description(s){where}")
+
+    applied = sum(len(descriptions) for descriptions in by_repo.values())
+    console.print(f"[bold]Done![/bold] {applied} commit(s) updated.")
+
+
+def _report_trace(stats: bool, trace_file: str | None, jsonl: bool) -> None:
+    if trace_file:
+        tracer.write_chrome_trace(Path(trace_file))
+    if not stats:
+        return
+
+    table = Table(title="Stats", title_justify="left")
+    table.add_column("Category")
+    table.add_column("Calls", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Mean", justify="right")
+    table.add_column("Details")
+    for category, summary in tracer.summary().items():
+        details = ", ".join(
+            f"{key}: {value:,}" for key, value in summary.totals.items()
+        )
+        table.add_row(
+            category,
+            str(summary.calls),
+            f"{summary.seconds:.2f}s",
+            f"{summary.seconds / summary.calls * 1000:.0f}ms",
+            details,
+        )
+    for name, value in tracer.counters.items():
+        table.add_row(name, str(value), "", "", "")
+
+    # In jsonl mode stdout carries records only
+    Console(stderr=jsonl, highlight=False).print(table)
+
+
+@contextmanager
+def _stream_preview(text: str) -> Iterator["OnPartial"]:
+    """Show a description while it streams in; cleared once it completes."""
+    with Live(
+        Text(text, style="dim"),
+        console=console,
+        transient=True,
+        refresh_per_second=12,
+    ) as live:
+
+        def on_partial(partial: str) -> None:
+            live.update(Padding(partial, (0, 0, 0, 4)))
+
+        yield on_partial
+
+
+def _generated_text(generated: Generated) -> str:
+    if generated.resumed:
+        return "  Generated description (previous run)"
+    return "  Generated description"
+
+
+def _print_succeed(text: str) -> None:
+    """Print a success line matching the spinner's succeed output."""
+    console.print(f"[green]✔[/green] {text}")
+
+
+def _apply_description(
+    jj: JJClient,
+    commit: Commit,
+    description: str,
+    pending: list[tuple[Commit, str]] | None,
+) -> str:
+    """Apply a description now, or queue it when batching. Returns the status."""
+    if pending is None:
+        jj.set_description(description, commit.change_id)
+        return "Applied"
+    pending.append((commit, description))
+    return "Queued"
+
+
 def _prompt_action() -> str:
+    import readchar
+
     console.print("  [dim]y: Apply / n: Skip / e: Edit / r: Regenerate / q: Quit[/dim]")
 
     while True:
@@ -10,16 +10,39 @@ from typing import Any, Optional
 import yaml
 from dotenv import dotenv_values
 
+from jj_aidesc.diff import DEFAULT_FOCUS_FILES, DEFAULT_MAX_DIFF_CHARS
 from jj_aidesc.error import ConfigError
+from jj_aidesc.routing import RoutingRule
+from jj_aidesc.scheduler import DEFAULT_MAX_RETRIES
 
 ENV_FILES = [".env", ".env.local"]
 CONFIG_FILES = [".jj-aidesc.yaml", ".jj-aidesc.yml"]
 API_KEY_ENV_VAR = "GOOGLE_GENAI_API_KEY"
+DEFAULT_PROVIDER = "google-genai"
+DEFAULT_SUMMARY_MODEL = "gemini-2.5-flash-lite"
 
 CONFIG_TEMPLATE = f"""\
 # jj-aidesc configuration file
 # See https://github.com/suda-3156/jj-aidesc for more information
 
+# Provider used by default: google-genai, openai-compatible
+# provider: google-genai
+
+# Local or self-hosted OpenAI-compatible endpoint (llama.cpp, Ollama, vLLM, ...)
+# openai-compatible:
+#   base_url: "http://localhost:11434/v1"
+#   model: "qwen2.5-coder"
+#   # api_key: "..."
+
+# Route diffs to other models; the first matching rule wins, otherwise the
+# default provider and model are used
+# routing:
+#   - max_chars: 4000
+#     max_files: 3
+#     model: "gemini-2.5-flash-lite"
+#   - provider: openai-compatible
+#     max_chars: 20000
+
 google-genai:
   # Google GenAI API key (can also be set via {API_KEY_ENV_VAR} env var)
   # api_key: "your-api-key-here"
@@ -35,6 +58,26 @@ google-genai:
 
   # Style: conventional, follow, simple
   style: conventional
+
+  # Maximum diff size in characters sent to the model (0: no limit)
+  max_diff_chars: {DEFAULT_MAX_DIFF_CHARS}
+
+  # Send change stats for every file but hunks only for this many of the most
+  # significant ones, with whitespace-only hunks dropped (unset: full diffs)
+  # focus_files: {DEFAULT_FOCUS_FILES}
+
+  # Summarize the parts of larger diffs in parallel instead of truncating them
+  map_reduce: false
+
+  # Model used for those summaries
+  summary_model: "{DEFAULT_SUMMARY_MODEL}"
+
+  # Quota of the API key; requests are paced to stay within it (unset: no limit)
+  # requests_per_minute: 10
+  # tokens_per_minute: 250000
+
+  # Retries on rate limit and transient server errors
+  max_retries: {DEFAULT_MAX_RETRIES}
 """
 
 
@@ -51,9 +94,9 @@ def _get_jj_root_dir() -> Path | None:
         return None
 
 
-def _get_search_dirs() -> list[Path]:
+def _get_search_dirs(jj_root: Path | None = None) -> list[Path]:
     dirs = [Path.cwd()]
-    jj_root = _get_jj_root_dir()
+    jj_root = jj_root or _get_jj_root_dir()
     if jj_root and jj_root != Path.cwd():
         dirs.append(jj_root)
     return dirs
@@ -67,14 +110,27 @@ class Config:
     _config_path: str | None
     _language: str | None
     _style: str | None
+    _max_diff_chars: int | None = None
+    _map_reduce: bool | None = None
+    _focus_files: int | None = None
+    _summary_model: str | None = None
+    _requests_per_minute: int | None = None
+    _tokens_per_minute: int | None = None
+    _provider: str | None = None
+    _jj_root: Path | None = None
 
     def __post_init__(self) -> None:
-        if not self.api_key:
+        providers = {self.provider, *(rule.provider for rule in self.routing)}
+        if DEFAULT_PROVIDER in providers and not self.api_key:
             raise ConfigError(
                 f"No API key found. Set via --api-key, config file, "
                 f".env, or {API_KEY_ENV_VAR} environment variable."
             )
 
+    @cached_property
+    def _search_dirs(self) -> list[Path]:
+        return _get_search_dirs(self._jj_root)
+
     @cached_property
     def _config(self) -> dict[str, Any] | None:
         # Explicit config path
@@ -86,7 +142,7 @@ class Config:
             raise ConfigError(f"Config file not found: {self._config_path}")
 
         # Search in cwd and jj root directory
-        for search_dir in _get_search_dirs():
+        for search_dir in self._search_dirs:
             for config_file in CONFIG_FILES:
                 config_path = search_dir / config_file
                 if config_path.exists():
@@ -96,9 +152,30 @@ class Config:
         return None
 
     def _from_config(self, key: str) -> Any | None:
-        if self._config and "google-genai" in self._config:
-            return self._config["google-genai"].get(key)
-        return None
+        # General settings live in the google-genai section for compatibility
+        # with older config files; top-level keys are accepted as well
+        value = self.provider_settings(DEFAULT_PROVIDER).get(key)
+        if value is None and self._config:
+            value = self._config.get(key)
+        return value
+
+    def provider_settings(self, provider: str) -> dict[str, Any]:
+        if self._config and isinstance(self._config.get(provider), dict):
+            return self._config[provider]
+        return {}
+
+    @property
+    def provider(self) -> str:
+        return (
+            self._provider or (self._config or {}).get("provider") or DEFAULT_PROVIDER
+        )
+
+    @cached_property
+    def routing(self) -> list[RoutingRule]:
+        rules = (self._config or {}).get("routing") or []
+        if not isinstance(rules, list):
+            raise ConfigError("routing must be a list of rules")
+        return [RoutingRule.from_config(rule) for rule in rules]
 
     @property
     def api_key(self) -> str:
@@ -111,7 +188,7 @@ class Config:
             return str(key)
 
         # 3. .env file (search cwd and jj root)
-        for search_dir in _get_search_dirs():
+        for search_dir in self._search_dirs:
             for env_file in ENV_FILES:
                 env_path = search_dir / env_file
                 if env_path.exists():
@@ -124,7 +201,12 @@ class Config:
 
     @property
     def model(self) -> Optional[str]:
-        return self._model or self._from_config("model")
+        # Model of the default provider
+        return (
+            self._model
+            or self.provider_settings(self.provider).get("model")
+            or (self._config or {}).get("model")
+        )
 
     @property
     def temperature(self) -> float:
@@ -153,3 +235,54 @@ class Config:
     @property
     def style(self) -> str:
         return self._style or self._from_config("style") or "conventional"
+
+    @property
+    def max_diff_chars(self) -> int:
+        if self._max_diff_chars is not None:
+            return self._max_diff_chars
+        config_max = self._from_config("max_diff_chars")
+        if config_max is not None:
+            return int(config_max)
+        return DEFAULT_MAX_DIFF_CHARS
+
+    @property
+    def focus_files(self) -> int | None:
+        if self._focus_files is not None:
+            return self._focus_files
+        config_focus = self._from_config("focus_files")
+        return int(config_focus) if config_focus is not None else None
+
+    @property
+    def map_reduce(self) -> bool:
+        if self._map_reduce is not None:
+            return self._map_reduce
+        return bool(self._from_config("map_reduce"))
+
+    @property
+    def summary_model(self) -> str:
+        return (
+            self._summary_model
+            or self._from_config("summary_model")
+            or DEFAULT_SUMMARY_MODEL
+        )
+
+    @property
+    def requests_per_minute(self) -> int | None:
+        if self._requests_per_minute is not None:
+            return self._requests_per_minute
+        config_rpm = self._from_config("requests_per_minute")
+        return int(config_rpm) if config_rpm is not None else None
+
+    @property
+    def tokens_per_minute(self) -> int | None:
+        if self._tokens_per_minute is not None:
+            return self._tokens_per_minute
+        config_tpm = self._from_config("tokens_per_minute")
+        return int(config_tpm) if config_tpm is not None else None
+
+    @property
+    def max_retries(self) -> int:
+        config_retries = self._from_config("max_retries")
+        if config_retries is not None:
+            return int(config_retries)
+        return DEFAULT_MAX_RETRIES
@@ -0,0 +1,347 @@
+"""Diff compaction before sending to the model."""
+
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+
+DEFAULT_MAX_DIFF_CHARS = 100_000
+DEFAULT_FOCUS_FILES = 5
+# Budget of the diff resent with feedback, next to the draft being revised
+DEFAULT_DIGEST_CHARS = 8_000
+
+# Context lines around changes in the focused view (jj defaults to 3)
+FOCUSED_CONTEXT_LINES = 1
+
+# Files whose content is noise to the model; they are reduced to one line.
+# `*` also matches `/`, so suffix patterns apply at any depth.
+COLLAPSED_PATTERNS: dict[str, list[str]] = {
+    "lockfile": [
+        "*.lock",
+        "*package-lock.json",
+        "*pnpm-lock.yaml",
+        "*go.sum",
+        "*poetry.lock",
+        "*Gemfile.lock",
+    ],
+    "vendored": [
+        "vendor/*",
+        "*/vendor/*",
+        "node_modules/*",
+        "*/node_modules/*",
+        "third_party/*",
+        "*/third_party/*",
+    ],
+    "generated": [
+        "*.min.js",
+        "*.min.css",
+        "*.map",
+        "*_pb2.py",
+        "*_pb2.pyi",
+        "*.pb.go",
+        "*.generated.*",
+        "*.snap",
+        "dist/*",
+    ],
+}
+
+# Files that say less about a change than source code; ranked lower.
+LOW_SIGNAL_PATTERNS = [
+    "*.md",
+    "*.rst",
+    "*.txt",
+    "docs/*",
+    "*/docs/*",
+    "test/*",
+    "tests/*",
+    "*/test/*",
+    "*/tests/*",
+    "*_test.*",
+    "*test_*.py",
+    "*.spec.*",
+    "*.test.*",
+]
+
+_DIFF_HEADER = re.compile(r"^diff --git a/(.*) b/(.*)$")
+# File lines of the stats that focus_diff puts before the hunks
+_FOCUS_STATS = re.compile(r"^# (.*) \(\+\d+ -\d+.*\)$")
+
+# Room kept for the marker line that replaces omitted hunks.
+_OMITTED_MARKER_RESERVE = 64
+
+
+@dataclass
+class FileDiff:
+    """The git diff of a single file, split into header and hunks."""
+
+    path: str
+    header: list[str]
+    hunks: list[list[str]] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.header) + "".join("".join(h) for h in self.hunks)
+
+    @property
+    def binary(self) -> bool:
+        return any(
+            line.startswith(("Binary files", "GIT binary patch"))
+            for line in self.header
+        )
+
+    def stats(self, hunks: list[list[str]] | None = None) -> tuple[int, int]:
+        """Count added and removed lines."""
+        added = removed = 0
+        for hunk in self.hunks if hunks is None else hunks:
+            for line in hunk[1:]:
+                if line.startswith("+"):
+                    added += 1
+                elif line.startswith("-"):
+                    removed += 1
+        return added, removed
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """Split a git-format diff into per-file sections."""
+    files: list[FileDiff] = []
+    current: FileDiff | None = None
+    for line in diff.splitlines(keepends=True):
+        if match := _DIFF_HEADER.match(line.rstrip("\n")):
+            current = FileDiff(path=match.group(2), header=[line])
+            files.append(current)
+        elif current is None:
+            continue
+        elif line.startswith("@@"):
+            current.hunks.append([line])
+        elif current.hunks:
+            current.hunks[-1].append(line)
+        else:
+            current.header.append(line)
+    return files
+
+
+def _preamble(diff: str) -> str:
+    lines: list[str] = []
+    for line in diff.splitlines(keepends=True):
+        if _DIFF_HEADER.match(line.rstrip("\n")):
+            break
+        lines.append(line)
+    return "".join(lines)
+
+
+def diff_paths(diff: str) -> list[str]:
+    """List the paths a diff touches, as given by its file headers or stats."""
+    paths: dict[str, None] = {}
+    for line in diff.splitlines():
+        if match := _DIFF_HEADER.match(line):
+            paths[match.group(2)] = None
+        elif match := _FOCUS_STATS.match(line):
+            paths[match.group(1)] = None
+    return list(paths)
+
+
+def collapse_kind(path: str) -> str | None:
+    """Return why a path should be collapsed, or None to keep its diff."""
+    for kind, patterns in COLLAPSED_PATTERNS.items():
+        if any(fnmatch(path, pattern) for pattern in patterns):
+            return kind
+    return None
+
+
+def _collapse(file: FileDiff, kind: str) -> str:
+    added, removed = file.stats()
+    return f"{file.header[0]}# {kind} changed (+{added} -{removed}), diff omitted\n"
+
+
+def _truncate(file: FileDiff, budget: int) -> str:
+    """Fit a file's diff into budget, keeping as many whole hunks as possible.
+
+    Smaller hunks are preferred since several complete hunks say more than a
+    single cut-off one; kept hunks are emitted in their original order.
+    """
+    header = "".join(file.header)
+    if len(header) > budget:
+        header = file.header[0]
+    remaining = budget - len(header) - _OMITTED_MARKER_RESERVE
+
+    sizes = [len("".join(hunk)) for hunk in file.hunks]
+    kept: set[int] = set()
+    for index in sorted(range(len(sizes)), key=sizes.__getitem__):
+        if sizes[index] > remaining:
+            break
+        kept.add(index)
+        remaining -= sizes[index]
+
+    omitted = [hunk for i, hunk in enumerate(file.hunks) if i not in kept]
+    text = header + "".join("".join(file.hunks[i]) for i in sorted(kept))
+    if omitted:
+        added, removed = file.stats(omitted)
+        text += f"@@ {len(omitted)} more hunk(s) omitted (+{added} -{removed}) @@\n"
+    return text
+
+
+@dataclass
+class DiffChunk:
+    """A part of a diff small enough to be sent in one request."""
+
+    paths: list[str]
+    text: str
+
+
+def _split_file(file: FileDiff, max_chars: int) -> list[str]:
+    """Split one file's diff into pieces at hunk boundaries, repeating the header."""
+    header = file.header[0]
+    pieces: list[str] = []
+    current = "".join(file.header)
+    empty = True
+    for hunk in file.hunks:
+        text = "".join(hunk)
+        if len(header) + len(text) > max_chars:
+            # A single hunk over budget is cut at a line boundary
+            text = text[: max(max_chars - len(header), 0)].rpartition("\n")[0] + "\n"
+        if len(current) + len(text) > max_chars and not empty:
+            pieces.append(current)
+            current = header
+        current += text
+        empty = False
+    pieces.append(current)
+    return pieces
+
+
+def split_diff(diff: str, max_chars: int) -> list[DiffChunk]:
+    """Split a git diff into chunks of at most max_chars each.
+
+    Files are collapsed as in `compact_diff`, then packed whole into chunks
+    in diff order; a file too large for one chunk is split into groups of
+    hunks. A diff that fits yields a single chunk.
+    """
+    chunks: list[DiffChunk] = []
+    for file in parse_diff(diff):
+        kind = "binary" if file.binary else collapse_kind(file.path)
+        text = _collapse(file, kind) if kind else file.text
+        pieces = [text] if len(text) <= max_chars else _split_file(file, max_chars)
+        for piece in pieces:
+            last = chunks[-1] if chunks else None
+            if last and len(last.text) + len(piece) <= max_chars:
+                last.text += piece
+                if last.paths[-1] != file.path:
+                    last.paths.append(file.path)
+            else:
+                chunks.append(DiffChunk(paths=[file.path], text=piece))
+    return chunks
+
+
+def _whitespace_only(hunk: list[str]) -> bool:
+    """Whether a hunk changes nothing but whitespace."""
+
+    def normalized(prefix: str) -> list[str]:
+        lines = (
+            re.sub(r"\s+", "", line[1:]) for line in hunk[1:] if line.startswith(prefix)
+        )
+        return [line for line in lines if line]
+
+    return normalized("-") == normalized("+")
+
+
+def _significance(file: FileDiff) -> float:
+    """Rank files by lines changed, weighted by how telling their type is."""
+    if file.binary or collapse_kind(file.path):
+        return 0.0
+    added, removed = file.stats()
+    weight = 0.5 if any(fnmatch(file.path, p) for p in LOW_SIGNAL_PATTERNS) else 1.0
+    return (added + removed) * weight
+
+
+def focus_diff(diff: str, max_files: int = DEFAULT_FOCUS_FILES) -> str:
+    """Reduce a diff to change stats for every file and hunks for the top files.
+
+    Whitespace-only hunks are dropped first. The `max_files` most
+    significant files keep their remaining hunks; every file is listed with
+    its added and removed line counts.
+    """
+    files = parse_diff(diff)
+    stats: list[str] = []
+    for file in files:
+        added, removed = file.stats()
+        hunks = [hunk for hunk in file.hunks if not _whitespace_only(hunk)]
+        note = ""
+        if len(hunks) < len(file.hunks):
+            note = f", {len(file.hunks) - len(hunks)} whitespace-only hunk(s)"
+        kind = "binary" if file.binary else collapse_kind(file.path)
+        if kind:
+            note += f", {kind}"
+        stats.append(f"# {file.path} (+{added} -{removed}{note})\n")
+        file.hunks = hunks
+
+    ranked = sorted(files, key=_significance, reverse=True)
+    shown = {id(file) for file in ranked[:max_files] if _significance(file) > 0}
+    omitted = len(files) - len(shown)
+
+    text = f"# {len(files)} file(s) changed\n" + "".join(stats)
+    if omitted:
+        text += f"# Hunks shown for the {len(shown)} most significant file(s)\n"
+    return text + "".join(file.text for file in files if id(file) in shown)
+
+
+def compact_diff(
+    diff: str,
+    max_chars: int = DEFAULT_MAX_DIFF_CHARS,
+    fallback: Callable[[], str] | None = None,
+) -> str:
+    """Reduce a git diff so that it fits into max_chars.
+
+    Lockfiles, binaries, vendored and generated files are always collapsed
+    into a one-line summary. If the rest is still over budget, the budget is
+    shared between files so that small files stay intact and large ones are
+    cut at hunk boundaries. If even that does not fit, the output of
+    `fallback` (e.g. a diff summary) is returned instead. A max_chars of 0
+    disables the budget. Text before the first file, such as the stats of
+    focus_diff, is kept.
+    """
+    files = parse_diff(diff)
+    kinds = ["binary" if file.binary else collapse_kind(file.path) for file in files]
+    if not any(kinds) and (not max_chars or len(diff) <= max_chars):
+        return diff
+
+    preamble = _preamble(diff)
+    parts = [
+        _collapse(file, kind) if kind else file.text for file, kind in zip(files, kinds)
+    ]
+    if not max_chars or len(preamble) + sum(len(part) for part in parts) <= max_chars:
+        return preamble + "".join(parts)
+
+    # Share the budget fairly: the smallest files are kept whole and any
+    # unused share is handed on to the larger ones.
+    expanded = [i for i, kind in enumerate(kinds) if not kind]
+    budget = (
+        max_chars
+        - len(preamble)
+        - sum(len(parts[i]) for i, kind in enumerate(kinds) if kind)
+    )
+    expanded.sort(key=lambda i: len(parts[i]))
+    for count, index in enumerate(expanded):
+        share = max(budget, 0) // (len(expanded) - count)
+        if len(parts[index]) > share:
+            parts[index] = _truncate(files[index], share)
+        budget -= len(parts[index])
+
+    compacted = preamble + "".join(parts)
+    if len(compacted) > max_chars and fallback is not None:
+        return fallback()
+    return compacted
+
+
+def digest_diff(diff: str, max_chars: int = DEFAULT_DIGEST_CHARS) -> str:
+    """Reduce a diff for a request that revises an existing description.
+
+    The draft already covers the diff, so a focused view of at most
+    `max_chars`, header included, is enough to act on feedback. Diffs
+    already within the budget and text without file sections (e.g.
+    summaries) are returned unchanged.
+    """
+    if len(diff) <= max_chars or not parse_diff(diff):
+        return diff
+    # A diff with stats before its files is focused already
+    focused = diff if _preamble(diff) else focus_diff(diff)
+    header = "# Digest of the diff the draft was written from\n"
+    return header + compact_diff(focused, max_chars - len(header))
@@ -35,6 +35,18 @@ class AIError(JJAIDescError):
     pass
 
 
+class ResponseError(AIError):
+    """AI response that could not be parsed."""
+
+    pass
+
+
+class InputError(JJAIDescError):
+    """Invalid input error."""
+
+    pass
+
+
 class AbortError(JJAIDescError):
     """User abort error."""
 
@@ -0,0 +1,104 @@
+"""Timing and token instrumentation."""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+
+@dataclass
+class Span:
+    """A timed operation, with free-form details such as token counts."""
+
+    name: str
+    category: str
+    start: float
+    duration: float
+    thread_id: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CategoryStats:
+    calls: int = 0
+    seconds: float = 0.0
+    totals: Counter[str] = field(default_factory=Counter)
+
+
+class Tracer:
+    """Collect spans and counters for a run. Does nothing until enabled."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: list[Span] = []
+        self.counters: Counter[str] = Counter()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """Time the enclosed block. Details can be added to the yielded dict."""
+        if not self.enabled:
+            yield args
+            return
+
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            span = Span(
+                name=name,
+                category=category,
+                start=start - self._origin,
+                duration=time.perf_counter() - start,
+                thread_id=threading.get_ident(),
+                args=args,
+            )
+            with self._lock:
+                self.spans.append(span)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    def summary(self) -> dict[str, CategoryStats]:
+        """Aggregate spans per category; numeric details are summed."""
+        stats: dict[str, CategoryStats] = {}
+        for span in self.spans:
+            category = stats.setdefault(span.category, CategoryStats())
+            category.calls += 1
+            category.seconds += span.duration
+            for key, value in span.args.items():
+                if isinstance(value, int) and not isinstance(value, bool):
+                    category.totals[key] += value
+        return stats
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """Write spans in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        events = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": span.start * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": span.args,
+            }
+            for span in self.spans
+        ]
+        path.write_text(json.dumps({"traceEvents": events}, default=str))
+
+
+tracer = Tracer()
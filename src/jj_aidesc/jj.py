@@ -1,8 +1,16 @@
+import logging
+import os
 import subprocess
+import tempfile
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from functools import cached_property
 from pathlib import Path
 
 from jj_aidesc.error import JJError
+from jj_aidesc.instrument import tracer
+
+log = logging.getLogger(__name__)
 
 
 @dataclass
@@ -13,124 +21,344 @@ class Commit:
     commit_id: str
     empty: bool
     files: list[str]
+    diff: str | None = None
+
+
+@dataclass
+class DescribedCommit:
+    """A commit's description and the files it touched."""
+
+    change_id: str
+    description: str
+    files: list[str]
+
+
+@dataclass(frozen=True)
+class RepoContext:
+    """jj installation and workspace facts, resolved once per client."""
+
+    version: str | None
+    root: Path | None
+
+
+# jj never emits NUL in template output of paths or git diffs, so it is a
+# safe separator for records that themselves contain tabs and newlines.
+FIELD_SEPARATOR = "\0"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _split_fields(chunks: Iterable[str], count: int) -> Iterator[list[str]]:
+    """Split streamed output into records of `count` NUL-terminated fields."""
+    pending: list[str] = []
+    fields: list[str] = []
+    for chunk in chunks:
+        *complete, rest = chunk.split(FIELD_SEPARATOR)
+        for piece in complete:
+            pending.append(piece)
+            fields.append("".join(pending))
+            pending = []
+            if len(fields) == count:
+                yield fields
+                fields = []
+        pending.append(rest)
 
 
 class JJClient:
-    """Wrapper for jj commands."""
+    """Wrapper for jj commands.
+
+    With `reuse_snapshot`, only the first read-only query snapshots the
+    working copy; later ones pass `--ignore-working-copy` and read the
+    repository as of that snapshot instead of re-scanning it. With
+    `ignore_working_copy`, read-only queries never snapshot.
+    """
 
-    def __init__(self, repo_path: Path | None = None):
+    def __init__(
+        self,
+        repo_path: Path | None = None,
+        reuse_snapshot: bool = False,
+        ignore_working_copy: bool = False,
+    ):
         self.repo_path = repo_path or Path.cwd()
+        self.reuse_snapshot = reuse_snapshot
+        self._snapshotted = ignore_working_copy
+        if ignore_working_copy:
+            self.reuse_snapshot = True
+
+    @cached_property
+    def context(self) -> RepoContext:
+        """Probe jj version and workspace root once."""
+        try:
+            result = subprocess.run(
+                ["jj", "version"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return RepoContext(version=None, root=None)
+        version = result.stdout.strip()
+
+        try:
+            root = Path(self._run("root").strip())
+        except JJError:
+            root = None
+        return RepoContext(version=version, root=root)
+
+    def _command(self, args: tuple[str, ...], readonly: bool) -> list[str]:
+        if not readonly:
+            return ["jj", *args]
+        if self.reuse_snapshot and self._snapshotted:
+            return ["jj", "--ignore-working-copy", *args]
+        self._snapshotted = True
+        return ["jj", *args]
 
-    def _run(self, *args: str) -> str:
+    def _run(
+        self, *args: str, readonly: bool = False, env: dict[str, str] | None = None
+    ) -> str:
         """Run a jj command and return stdout."""
-        result = subprocess.run(
-            ["jj", *args],
-            cwd=self.repo_path,
-            capture_output=True,
-            text=True,
-        )
+        command = self._command(args, readonly)
+        with tracer.span(f"jj {args[0]}", "jj", readonly=readonly) as span:
+            result = subprocess.run(
+                command,
+                cwd=self.repo_path,
+                capture_output=True,
+                text=True,
+                env={**os.environ, **env} if env else None,
+            )
+            span["output_chars"] = len(result.stdout)
         if result.returncode != 0:
             raise JJError(f"jj command failed: {result.stderr.strip()}")
         return result.stdout
 
+    def _stream(self, *args: str, readonly: bool = False) -> Iterator[str]:
+        """Run a jj command and yield its stdout in chunks as it is produced."""
+        command = self._command(args, readonly)
+        with (
+            tempfile.TemporaryFile() as stderr,
+            tracer.span(f"jj {args[0]}", "jj", readonly=readonly) as span,
+        ):
+            process = subprocess.Popen(
+                command,
+                cwd=self.repo_path,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                text=True,
+            )
+            assert process.stdout is not None
+            span["output_chars"] = 0
+            with process.stdout:
+                while chunk := process.stdout.read(STREAM_CHUNK_SIZE):
+                    span["output_chars"] += len(chunk)
+                    yield chunk
+            if process.wait() != 0:
+                stderr.seek(0)
+                message = stderr.read().decode(errors="replace").strip()
+                raise JJError(f"jj command failed: {message}")
+
     def get_commits_without_description(
-        self, revset: str = "mutable()", include_described: bool = False
+        self,
+        revset: str = "mutable()",
+        include_described: bool = False,
+        with_diff: bool = False,
+        since_operation: str | None = None,
+        context: int | None = None,
     ) -> list[Commit]:
-        """Get commits without description that have changes."""
-        # Template: change_id<TAB>commit_id<TAB>empty_status<TAB>files
-        template = (
-            'change_id.short() ++ "\\t" ++ '
-            'commit_id.short() ++ "\\t" ++ '
-            'if(empty, "empty", "has_changes") ++ "\\t" ++ '
-            'self.diff().files().map(|f| f.path()).join(",") ++ "\\n"'
-        )
+        """Get commits without description that have changes.
+
+        With `with_diff`, the git-format diff of every commit is fetched by
+        the same `jj log` invocation instead of one `jj diff` per commit.
+        With `since_operation`, only commits that did not match as of that
+        operation are returned (new or rewritten ones). `context` sets the
+        number of unchanged lines around each change (jj's default if None).
+        """
+        # Template: change_id NUL commit_id NUL empty_status NUL files NUL [diff NUL]
+        fields = [
+            "change_id.short()",
+            "commit_id.short()",
+            'if(empty, "empty", "has_changes")',
+            'self.diff().files().map(|f| f.path()).join("\\n")',
+        ]
+        if with_diff:
+            fields.append(f"self.diff().git({'' if context is None else context})")
+        template = " ++ ".join(f'{field} ++ "\\0"' for field in fields)
 
         rev_operator = f"({revset}) & ~empty()"
         if not include_described:
             rev_operator += ' & description(exact:"")'
+        if since_operation:
+            rev_operator = (
+                f"({rev_operator}) ~ at_operation({since_operation}, {rev_operator})"
+            )
 
-        output = self._run(
+        chunks = self._stream(
             "log",
             "--no-graph",
             "-T",
             template,
             "-r",
             rev_operator,
+            readonly=True,
         )
 
         commits = []
-        for line in output.strip().split("\n"):
-            if not line:
-                continue
-            parts = line.split("\t")
-            if len(parts) >= 3:
-                change_id = parts[0]
-                commit_id = parts[1]
-                empty = parts[2] == "empty"
-                files = parts[3].split(",") if len(parts) > 3 and parts[3] else []
-                commits.append(
-                    Commit(
-                        change_id=change_id,
-                        commit_id=commit_id,
-                        empty=empty,
-                        files=files,
-                    )
+        for parts in _split_fields(chunks, len(fields)):
+            commits.append(
+                Commit(
+                    change_id=parts[0],
+                    commit_id=parts[1],
+                    empty=parts[2] == "empty",
+                    files=parts[3].split("\n") if parts[3] else [],
+                    diff=parts[4] if with_diff else None,
                 )
+            )
 
         return commits
 
-    def get_diff(self, revision: str) -> str:
+    def get_operation_id(self) -> str:
+        """Get the id of the current operation."""
+        output = self._run(
+            "op", "log", "--no-graph", "-n", "1", "-T", "self.id()", readonly=True
+        )
+        return output.strip()
+
+    def get_op_heads_dir(self) -> Path | None:
+        """Locate the directory holding the repository's operation heads.
+
+        Listing it tells whether the repository changed without starting jj.
+        Returns None if the store layout is not the expected one.
+        """
+        repo = self.get_root() / ".jj" / "repo"
+        # Secondary workspaces point to the main repository with a file
+        if repo.is_file():
+            repo = (repo.parent / repo.read_text().strip()).resolve()
+        heads = repo / "op_heads" / "heads"
+        return heads if heads.is_dir() else None
+
+    def get_diff(self, revision: str, context: int | None = None) -> str:
         """Get diff for a revision in git format."""
-        return self._run("diff", "--git", "-r", revision)
+        args = ["diff", "--git", "-r", revision]
+        if context is not None:
+            args += ["--context", str(context)]
+        return self._run(*args, readonly=True)
 
     def get_diff_summary(self, revision: str) -> str:
         """Get diff summary for a revision."""
-        return self._run("diff", "-r", revision, "--summary")
+        return self._run("diff", "-r", revision, "--summary", readonly=True)
 
     def set_description(self, description: str, revision: str) -> None:
         """Set description for a revision."""
-        self._run("describe", "-r", revision, "-m", description)
+        with tracer.span("set_description", "apply", commits=1):
+            self._run("describe", "-r", revision, "-m", description)
+
+    def set_descriptions(self, descriptions: list[tuple[Commit, str]]) -> None:
+        """Set descriptions for several commits in a single jj operation.
+
+        Uses the bulk editor format of `jj describe -r A -r B`, with an editor
+        command that copies the prepared message in place, so the whole batch
+        can be reverted with one `jj op undo`. Commits are addressed by their
+        current commit IDs, resolved from the change IDs just before, since
+        they may have been rewritten since the scan. Falls back to one
+        describe per commit if jj rejects the bulk message.
+        """
+        if len(descriptions) <= 1:
+            self._describe_each(descriptions)
+            return
+
+        try:
+            commit_ids = self.get_commit_ids([c.change_id for c, _ in descriptions])
+        except JJError as e:
+            log.warning(f"Could not resolve commits, describing one by one: {e}")
+            self._describe_each(descriptions)
+            return
+        if len(commit_ids) < len(descriptions):
+            self._describe_each(descriptions)
+            return
+
+        message = "".join(
+            f"JJ: describe {commit_ids[commit.change_id]} -------\n{description}\n\n"
+            for commit, description in descriptions
+        )
+        revisions = [
+            arg
+            for commit, _ in descriptions
+            for arg in ("-r", commit_ids[commit.change_id])
+        ]
+
+        fd, path = tempfile.mkstemp(suffix=".jjdescription")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(message)
+            with tracer.span("set_descriptions", "apply", commits=len(descriptions)):
+                self._run("describe", *revisions, env={"JJ_EDITOR": f"cp {path}"})
+        except JJError as e:
+            log.warning(f"Bulk describe failed, describing one by one: {e}")
+            self._describe_each(descriptions)
+        finally:
+            os.unlink(path)
+
+    def _describe_each(self, descriptions: list[tuple[Commit, str]]) -> None:
+        for commit, description in descriptions:
+            self.set_description(description, commit.change_id)
+
+    def get_commit_ids(self, change_ids: list[str]) -> dict[str, str]:
+        """Map change IDs (or prefixes) to the current IDs of their commits.
 
-    def get_existing_descriptions(
-        self, revset: str = "mutable()", limit: int = 10
-    ) -> list[str]:
-        """Get existing descriptions for style analysis."""
-        template = 'description ++ "\\n---SEPARATOR---\\n"'
+        Snapshots the working copy first, so a working-copy commit rewritten
+        by edits since the scan resolves to its new commit ID.
+        """
+        template = 'change_id ++ "\\0" ++ commit_id.short() ++ "\\0"'
         output = self._run(
-            "log",
-            "--no-graph",
-            "-T",
-            template,
-            "-r",
-            f'({revset}) & ~description(exact:"")',
-            "-n",
-            str(limit),
+            "log", "--no-graph", "-T", template, "-r", "|".join(change_ids)
         )
+        resolved = list(_split_fields([output], 2))
+        return {
+            change_id: commit_id
+            for change_id in change_ids
+            for full_id, commit_id in resolved
+            if full_id.startswith(change_id)
+        }
 
-        descriptions = []
-        for desc in output.split("---SEPARATOR---"):
-            desc = desc.strip()
-            if desc:
-                descriptions.append(desc)
+    def get_described_commits(
+        self, since_operation: str | None = None, limit: int | None = None
+    ) -> list[DescribedCommit]:
+        """Get described commits anywhere in the repository, newest first.
 
-        return descriptions
+        With `since_operation`, only commits that were not visible and
+        described as of that operation are returned.
+        """
+        fields = [
+            "change_id.short()",
+            "description",
+            'self.diff().files().map(|f| f.path()).join("\\n")',
+        ]
+        template = " ++ ".join(f'{field} ++ "\\0"' for field in fields)
+
+        revset = '~description(exact:"")'
+        if since_operation:
+            revset = f"({revset}) ~ at_operation({since_operation}, {revset})"
+        args = ["log", "--no-graph", "-T", template, "-r", revset]
+        if limit is not None:
+            args += ["-n", str(limit)]
+
+        return [
+            DescribedCommit(
+                change_id=parts[0],
+                description=parts[1].strip(),
+                files=parts[2].split("\n") if parts[2] else [],
+            )
+            for parts in _split_fields(self._stream(*args, readonly=True), len(fields))
+        ]
 
     def check_jj_available(self) -> bool:
         """Check if jj is available."""
-        try:
-            subprocess.run(
-                ["jj", "version"],
-                capture_output=True,
-                check=True,
-            )
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+        return self.context.version is not None
+
+    def get_root(self) -> Path:
+        """Get the root directory of the repository."""
+        if self.context.root is None:
+            raise JJError("Not in a jj repository")
+        return self.context.root
 
     def is_in_repo(self) -> bool:
         """Check if current directory is in a jj repository."""
-        try:
-            self._run("root")
-            return True
-        except JJError:
-            return False
+        return self.context.root is not None
@@ -0,0 +1,94 @@
+"""Progress journal that lets an interrupted run be resumed."""
+
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Literal
+
+from jj_aidesc.cache import normalize_diff
+from jj_aidesc.storage import write_json
+
+log = logging.getLogger(__name__)
+
+JOURNAL_FILE_NAME = "aidesc-journal.json"
+JOURNAL_VERSION = 1
+
+State = Literal["generated", "accepted", "edited", "skipped"]
+
+
+def diff_hash(diff: str) -> str:
+    return hashlib.sha256(normalize_diff(diff).encode()).hexdigest()
+
+
+@dataclass
+class JournalEntry:
+    diff_hash: str
+    state: State
+    description: str
+
+
+class Journal:
+    """Per-commit progress of a run, keyed by change_id and the hash of its diff.
+
+    The whole journal is rewritten atomically on every update, so it always
+    reflects the last finished step even if the process dies. An entry only
+    applies while the commit's diff is unchanged.
+    """
+
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = path
+        self.entries: dict[str, JournalEntry] = self._load() if resume else {}
+        self._lock = threading.Lock()
+
+    def lookup(self, change_id: str, diff: str) -> JournalEntry | None:
+        entry = self.entries.get(change_id)
+        if entry and entry.diff_hash == diff_hash(diff):
+            return entry
+        return None
+
+    def record_generated(self, change_id: str, diff: str, description: str) -> None:
+        with self._lock:
+            self.entries[change_id] = JournalEntry(
+                diff_hash(diff), "generated", description
+            )
+            self._save()
+
+    def record(
+        self, change_id: str, state: State, description: str | None = None
+    ) -> None:
+        """Update the state of a commit already in the journal."""
+        with self._lock:
+            entry = self.entries.get(change_id)
+            if entry is None:
+                return
+            entry.state = state
+            if description is not None:
+                entry.description = description
+            self._save()
+
+    def _load(self) -> dict[str, JournalEntry]:
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") != JOURNAL_VERSION:
+                return {}
+            return {
+                change_id: JournalEntry(**entry)
+                for change_id, entry in data["entries"].items()
+            }
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning(f"Ignoring unreadable journal {self.path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        data = {
+            "version": JOURNAL_VERSION,
+            "entries": {
+                change_id: asdict(entry) for change_id, entry in self.entries.items()
+            },
+        }
+        write_json(self.path, data, "journal")
@@ -0,0 +1,323 @@
+"""Concurrent description generation."""
+
+import functools
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from jj_aidesc.diff import (
+    DEFAULT_MAX_DIFF_CHARS,
+    FOCUSED_CONTEXT_LINES,
+    compact_diff,
+    focus_diff,
+    split_diff,
+)
+from jj_aidesc.jj import Commit, JJClient
+from jj_aidesc.journal import Journal, State
+
+if TYPE_CHECKING:
+    from jj_aidesc.ai import AI, Generation, OnPartial, Summarizer
+    from jj_aidesc.routing import Router
+
+DEFAULT_JOBS = 4
+DEFAULT_PREFETCH = 2
+
+# How often a streamed description is checked while waiting for a worker
+PARTIAL_POLL_SECONDS = 0.05
+
+
+@dataclass
+class Generated:
+    """A commit together with its diff and generated description."""
+
+    commit: Commit
+    diff: str
+    description: str
+    diff_size: int = 0
+    cached: bool = False
+    latency: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+    # State recorded by a previous run that is being resumed
+    resumed: State | None = None
+
+
+class Pipeline:
+    """Fetch diffs and generate descriptions ahead of the interactive review.
+
+    Commits are submitted in review order, so with a bounded pool the
+    commit the user reaches next is always the one closest to completion.
+    With a `lookahead`, only that many commits beyond the one being
+    reviewed are generated speculatively, so quitting early does not pay
+    for the rest of the stack. With a `batch_size` above 1, consecutive
+    commits are packed into shared requests of at most `max_diff_chars`.
+    With `focus_files`, diffs are reduced to per-file stats and the hunks
+    of that many files before they are compacted. Pipelines of several
+    repositories can share one `executor`, which then bounds their
+    combined parallelism instead of `jobs`. With `stream`, workers stream
+    their descriptions so that `take` can show them while waiting.
+    """
+
+    def __init__(
+        self,
+        jj: JJClient,
+        ai: "AI | Router",
+        jobs: int = DEFAULT_JOBS,
+        max_diff_chars: int = DEFAULT_MAX_DIFF_CHARS,
+        journal: Journal | None = None,
+        summarizer: "Summarizer | None" = None,
+        lookahead: int | None = None,
+        batch_size: int = 1,
+        focus_files: int | None = None,
+        executor: ThreadPoolExecutor | None = None,
+        stream: bool = False,
+    ):
+        self.jj = jj
+        self.ai = ai
+        self.max_diff_chars = max_diff_chars
+        self.journal = journal
+        self.summarizer = summarizer
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self.focus_files = focus_files
+        self.stream = stream
+        # Latest partial description of each commit a worker is streaming
+        self._partials: dict[str, str] = {}
+        # A shared executor is left running for the other pipelines
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=jobs, thread_name_prefix="jj-aidesc"
+        )
+        self._futures: list[tuple[Commit, Future[Generated]]] = []
+        # Commits not scheduled yet, grouped into the units generated together
+        self._waiting: deque[list[Commit]] = deque()
+        self._closed = threading.Event()
+
+    def __enter__(self) -> "Pipeline":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+    def submit(self, commits: list[Commit]) -> None:
+        """Schedule generation for commits, in the order they will be reviewed."""
+        self._waiting.extend(self._pack(commits))
+        self._schedule(None if self.lookahead is None else 1 + self.lookahead)
+
+    def results(self) -> Iterator[tuple[Commit, Future[Generated]]]:
+        """Yield commits and their pending results in submission order.
+
+        Reaching a commit schedules the ones within the lookahead after it.
+        """
+        index = 0
+        while index < len(self._futures) or self._waiting:
+            if self.lookahead is not None:
+                self._schedule(index + 1 + self.lookahead)
+            else:
+                self._schedule(None)
+            yield self._futures[index]
+            index += 1
+
+    def completed(self) -> Iterator[tuple[Commit, Future[Generated]]]:
+        """Yield commits and their results as soon as each finishes."""
+        self._schedule(None)
+        commits = {future: commit for commit, future in self._futures}
+        for future in as_completed(commits):
+            yield commits[future], future
+
+    def take(
+        self,
+        commit: Commit,
+        future: Future[Generated],
+        on_partial: "OnPartial | None" = None,
+    ) -> Generated:
+        """Wait for a commit's result.
+
+        With `on_partial`, a commit no worker has started on yet is generated
+        in the foreground instead, so its description can be streamed; for
+        one already in progress, the description its worker streams is
+        reported as it grows.
+        """
+        if on_partial is None:
+            return future.result()
+        if future.cancel():
+            return self._generate(commit, on_partial)
+
+        shown = None
+        while True:
+            try:
+                return future.result(timeout=PARTIAL_POLL_SECONDS)
+            except TimeoutError:
+                partial = self._partials.get(commit.change_id)
+                if partial and partial != shown:
+                    on_partial(partial)
+                    shown = partial
+
+    def shutdown(self) -> None:
+        """Cancel pending work and release the worker threads.
+
+        Generations that already started stop before their model request;
+        requests in flight are left to finish but their results are unused.
+        """
+        self._closed.set()
+        self._waiting.clear()
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        # Batch results are only set by their task, which may never run now,
+        # and tasks on a shared executor are not cancelled by its shutdown
+        for _, future in self._futures:
+            future.cancel()
+
+    def _schedule(self, count: int | None) -> None:
+        """Schedule waiting commits until `count` are scheduled (None: all)."""
+        while self._waiting and (count is None or len(self._futures) < count):
+            unit = self._waiting.popleft()
+            if len(unit) == 1:
+                future = self._executor.submit(self._generate, unit[0])
+                self._futures.append((unit[0], future))
+                continue
+            futures: list[Future[Generated]] = [Future() for _ in unit]
+            self._executor.submit(self._generate_batch, unit, futures)
+            self._futures.extend(zip(unit, futures, strict=True))
+
+    def _pack(self, commits: list[Commit]) -> list[list[Commit]]:
+        """Group consecutive commits into batches that fit one request.
+
+        Sizes are estimated from the raw diffs, capped at the per-diff
+        budget that compaction enforces.
+        """
+        units: list[list[Commit]] = []
+        size = 0
+        for commit in commits:
+            estimate = len(commit.diff) if commit.diff is not None else 0
+            if self.max_diff_chars:
+                estimate = min(estimate or self.max_diff_chars, self.max_diff_chars)
+            if (
+                units
+                and len(units[-1]) < self.batch_size
+                and (not self.max_diff_chars or size + estimate <= self.max_diff_chars)
+            ):
+                units[-1].append(commit)
+                size += estimate
+            else:
+                units.append([commit])
+                size = estimate
+        return units
+
+    def _generate(
+        self, commit: Commit, on_partial: "OnPartial | None" = None
+    ) -> Generated:
+        start = time.perf_counter()
+        diff = self._diff(commit)
+        if resumed := self._resumed(commit, diff, start):
+            return resumed
+
+        compacted = self._compact(commit, diff)
+        if self._closed.is_set():
+            raise CancelledError()
+        report = on_partial
+        if report is None and self.stream:
+            # Kept for take() to show should the commit come up for review
+            report = functools.partial(self._partials.__setitem__, commit.change_id)
+
+        try:
+            generation = self.ai.generate_detached(compacted, report)
+        finally:
+            self._partials.pop(commit.change_id, None)
+        return self._generated(commit, diff, compacted, generation, start)
+
+    def _generate_batch(
+        self, commits: list[Commit], futures: list[Future[Generated]]
+    ) -> None:
+        """Generate a batch of commits and resolve their futures."""
+        # Commits cancelled in the meantime (e.g. to stream them) are left out
+        running = [
+            (commit, future)
+            for commit, future in zip(commits, futures, strict=True)
+            if future.set_running_or_notify_cancel()
+        ]
+        try:
+            start = time.perf_counter()
+            prepared: dict[str, tuple[Commit, Future[Generated], str, str]] = {}
+            for commit, future in running:
+                diff = self._diff(commit)
+                if resumed := self._resumed(commit, diff, start):
+                    future.set_result(resumed)
+                else:
+                    compacted = self._compact(commit, diff)
+                    prepared[commit.change_id] = (commit, future, diff, compacted)
+            if self._closed.is_set():
+                raise CancelledError()
+
+            generations = self.ai.generate_batch(
+                {change_id: item[3] for change_id, item in prepared.items()}
+            )
+            for change_id, (commit, future, diff, compacted) in prepared.items():
+                generated = self._generated(
+                    commit, diff, compacted, generations[change_id], start
+                )
+                future.set_result(generated)
+        except BaseException as e:
+            for _, future in running:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _diff(self, commit: Commit) -> str:
+        if commit.diff is not None:
+            return commit.diff
+        context = FOCUSED_CONTEXT_LINES if self.focus_files is not None else None
+        return self.jj.get_diff(commit.change_id, context)
+
+    def _resumed(self, commit: Commit, diff: str, start: float) -> Generated | None:
+        entry = self.journal.lookup(commit.change_id, diff) if self.journal else None
+        if entry is None:
+            return None
+        return Generated(
+            commit=commit,
+            diff=self._compact(commit, diff, summarize=False),
+            description=entry.description,
+            diff_size=len(diff),
+            latency=time.perf_counter() - start,
+            resumed=entry.state,
+        )
+
+    def _generated(
+        self,
+        commit: Commit,
+        diff: str,
+        compacted: str,
+        generation: "Generation",
+        start: float,
+    ) -> Generated:
+        if self.journal:
+            self.journal.record_generated(commit.change_id, diff, generation.message)
+        return Generated(
+            commit=commit,
+            diff=compacted,
+            description=generation.message,
+            diff_size=len(diff),
+            cached=generation.cached,
+            latency=time.perf_counter() - start,
+            input_tokens=generation.input_tokens,
+            output_tokens=generation.output_tokens,
+            cached_input_tokens=generation.cached_input_tokens,
+        )
+
+    def _compact(self, commit: Commit, diff: str, summarize: bool = True) -> str:
+        """Fit a diff into the budget, summarizing its parts if a summarizer is set."""
+        if self.focus_files is not None:
+            diff = focus_diff(diff, self.focus_files)
+        if summarize and self.summarizer and self.max_diff_chars:
+            chunks = split_diff(diff, self.max_diff_chars)
+            if len(chunks) > 1:
+                return self.summarizer.summarize(chunks)
+        return compact_diff(
+            diff,
+            self.max_diff_chars,
+            fallback=lambda: self.jj.get_diff_summary(commit.change_id),
+        )
@@ -56,3 +56,38 @@ PROMPTS = {
         "</guidelines>",
     ),
 }
+
+# Map step for diffs too large for one request; the summaries are then
+# described with the selected style.
+SUMMARY_PROMPT = (
+    "system",
+    "<persona>You summarize one part of a large change for an engineer who will write its commit message.</persona>\n"
+    "<objectives>\n"
+    "  <objective>The input is part of a diff, or summaries of several parts of it.</objective>\n"
+    "  <objective>Describe what changed and, where the code shows it, why.</objective>\n"
+    "</objectives>\n"
+    "<guidelines>\n"
+    "  <guideline>Answer with up to 5 short bullet points `-`, most significant first.</guideline>\n"
+    "  <guideline>Name the files, functions or components involved.</guideline>\n"
+    "  <guideline>Leave out trivial changes such as formatting or renamed locals.</guideline>\n"
+    "  <guideline>Write in English.</guideline>\n"
+    "</guidelines>",
+)
+
+# Human message for describing several commits in one request
+BATCH_INSTRUCTIONS = (
+    "<commits>\n{commits}</commits>\n\n"
+    "<instructions>\n"
+    "  <instruction>Write one commit message for each commit above, following the guidelines for each one.</instruction>\n"
+    "  <instruction>The commits are listed oldest first and may build on each other; keep their messages consistent.</instruction>\n"
+    "  <instruction>Return every message together with the change_id of its commit.</instruction>\n"
+    "</instructions>"
+)
+
+# Fills the existing messages of the system prompt when they are chosen per diff
+EXISTING_WITH_DIFF = (
+    "(Given with each diff: messages of earlier commits that touched the same files.)"
+)
+
+# Prefix of the human message with the existing messages chosen for a diff
+EXISTING_MESSAGES = "<existing-messages>\n{messages}\n</existing-messages>\n"
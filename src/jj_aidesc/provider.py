@@ -1,38 +1,321 @@
-from typing import Optional, Protocol
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Optional, Protocol
 
-from langchain_core.language_models import BaseChatModel
-from langchain_google_genai import ChatGoogleGenerativeAI
+from jj_aidesc.config import DEFAULT_PROVIDER, Config
+from jj_aidesc.error import ConfigError
+from jj_aidesc.instrument import tracer
+from jj_aidesc.scheduler import estimate_tokens
 
-from jj_aidesc.config import Config
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+log = logging.getLogger(__name__)
+
+# Idle connections are kept open this long, so requests separated by the
+# user's think time do not repeat the TCP and TLS handshakes
+KEEPALIVE_SECONDS = 300
+
+# Gemini rejects explicit caches smaller than this; Gemini 2.5 also caches
+# repeated prefixes of that size implicitly
+MIN_CONTEXT_CACHE_TOKENS = 1024
+# Explicit caches are billed for storage until they expire
+CONTEXT_CACHE_TTL_SECONDS = 900
+# A cache is uploaded again this long before it expires, so requests that
+# are already on their way still find it
+CONTEXT_CACHE_RENEW_SECONDS = 60
 
 
 class Provider(Protocol):
     name: str
     model_name: str
-    chat_model: BaseChatModel
+    summary_model_name: str
+
+    @property
+    def chat_model(self) -> "BaseChatModel": ...
+
+    @property
+    def summary_chat_model(self) -> "BaseChatModel": ...
+
+    def warm_up(self) -> None: ...
+
+    def cached_chat_model(self, system_text: str) -> "BaseChatModel | None": ...
+
+    def drop_cached_chat_model(self, chat_model: "BaseChatModel") -> None: ...
+
+
+@dataclass
+class _ContextCache:
+    """An explicit cache of a system prompt and the chat model using it."""
+
+    name: str
+    expires: float  # time.monotonic()
+    chat_model: "BaseChatModel"
+
+
+class _BaseProvider(ABC):
+    """Chat models created once per model name, safe to use from several threads."""
+
+    name: str
+    model_name: str
+    summary_model_name: str
+
+    def __init__(self) -> None:
+        self._models: dict[str, BaseChatModel] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def chat_model(self) -> "BaseChatModel":
+        return self._get(self.model_name)
+
+    @property
+    def summary_chat_model(self) -> "BaseChatModel":
+        return self._get(self.summary_model_name)
+
+    def warm_up(self) -> None:
+        """Create the client and open its connection before the first request.
+
+        Meant to run in the background while the repository is scanned;
+        failures are left for the first real request to report.
+        """
+        try:
+            with tracer.span("warm up", "warm-up", provider=self.name):
+                self._connect(self.chat_model)
+        except Exception as e:
+            log.debug(f"Warm-up of {self.name} failed: {e}")
+
+    def cached_chat_model(self, system_text: str) -> "BaseChatModel | None":
+        """A chat model whose requests reference `system_text` cached on the
+        provider side, or None if it cannot be cached explicitly.
+
+        Servers that reuse the prompt prefix of the previous request on
+        their own need nothing beyond the unchanged system prompt.
+        """
+        return None
 
+    def drop_cached_chat_model(self, chat_model: "BaseChatModel") -> None:
+        """Forget the cache `chat_model` uses after a request on it failed,
+        so the next call of cached_chat_model uploads the prompt again.
+        """
 
-class GoogleGenAIProvider:
+    def _get(self, model: str) -> "BaseChatModel":
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = self._create(model)
+            return self._models[model]
+
+    @abstractmethod
+    def _create(self, model: str, **options: Any) -> "BaseChatModel":
+        """Create the chat model for `model`, with extra client `options`."""
+
+    @abstractmethod
+    def _connect(self, chat_model: Any) -> None:
+        """Open the connection of `chat_model` with a cheap request."""
+
+
+class GoogleGenAIProvider(_BaseProvider):
     def __init__(
         self,
         api_key: str,
         model: Optional[str],
         temperature: float,
+        summary_model: Optional[str] = None,
     ):
+        super().__init__()
         self.name: str = "google-genai"
         self.model_name: str = model or "gemini-2.5-flash"
+        self.summary_model_name: str = summary_model or self.model_name
         self.temperature: float = temperature
         self._api_key: str = api_key
-        self.chat_model: BaseChatModel = ChatGoogleGenerativeAI(
-            model=self.model_name,
-            google_api_key=api_key,
-            temperature=temperature,
+        # Explicit caches created for system prompts; None if unavailable
+        self._caches: dict[str, _ContextCache | None] = {}
+
+    def _create(self, model: str, **options: Any) -> "BaseChatModel":
+        # Imported on first use: the Google client stack is slow to import
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        # The client holds one channel that all requests of a run share
+        return ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=self._api_key,
+            temperature=self.temperature,
+            # Retries are paced by the scheduler, which also knows the quota
+            max_retries=1,
+            **options,
         )
 
+    def cached_chat_model(self, system_text: str) -> "BaseChatModel | None":
+        if estimate_tokens(system_text) < MIN_CONTEXT_CACHE_TOKENS:
+            return None
+        with self._lock:
+            cache = self._caches.get(system_text)
+            if system_text not in self._caches or (
+                cache is not None and cache.expires <= time.monotonic()
+            ):
+                cache = self._create_cache(system_text)
+                self._caches[system_text] = cache
+        return cache.chat_model if cache is not None else None
+
+    def drop_cached_chat_model(self, chat_model: "BaseChatModel") -> None:
+        with self._lock:
+            for system_text, cache in self._caches.items():
+                if cache is not None and cache.chat_model is chat_model:
+                    del self._caches[system_text]
+                    return
+
+    def _create_cache(self, system_text: str) -> _ContextCache | None:
+        """Upload a system prompt as an explicit cache."""
+        try:
+            # The client langchain-google-genai itself generates with
+            from google.ai.generativelanguage_v1beta import (
+                CachedContent,
+                CacheServiceClient,
+                Content,
+                Part,
+            )
+            from google.api_core.exceptions import GoogleAPIError
+        except ImportError as e:
+            log.warning(f"Context caching needs google-ai-generativelanguage: {e}")
+            return None
 
-def get_provider(config: Config) -> Provider:
+        model = self.model_name
+        if not model.startswith("models/"):
+            model = f"models/{model}"
+        created = time.monotonic()
+        try:
+            client = CacheServiceClient(client_options={"api_key": self._api_key})
+            with tracer.span("create context cache", "model", provider=self.name):
+                cache = client.create_cached_content(
+                    cached_content=CachedContent(
+                        model=model,
+                        display_name="jj-aidesc",
+                        system_instruction=Content(parts=[Part(text=system_text)]),
+                        ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+                    )
+                )
+        except GoogleAPIError as e:
+            # e.g. a model without explicit caching
+            log.info(f"Context caching unavailable for {self.model_name}: {e}")
+            return None
+        return _ContextCache(
+            name=cache.name,
+            expires=created + CONTEXT_CACHE_TTL_SECONDS - CONTEXT_CACHE_RENEW_SECONDS,
+            chat_model=self._create(self.model_name, cached_content=cache.name),
+        )
+
+    def _connect(self, chat_model: Any) -> None:
+        # Token counting is free and goes over the same channel as generation
+        chat_model.get_num_tokens("warm-up")
+
+
+class OpenAICompatibleProvider(_BaseProvider):
+    """A server speaking the OpenAI chat completions API, e.g. llama.cpp or Ollama."""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: Optional[str],
+        temperature: float,
+        api_key: Optional[str] = None,
+        summary_model: Optional[str] = None,
+    ):
+        if not model:
+            raise ConfigError("No model set for the openai-compatible provider.")
+        super().__init__()
+        self.name: str = "openai-compatible"
+        self.model_name: str = model
+        self.summary_model_name: str = summary_model or self.model_name
+        self.temperature: float = temperature
+        self.base_url: str = base_url
+        # Local servers usually accept any key, but the client requires one
+        self._api_key: str = api_key or "unused"
+        self._http_client: Any = None
+
+    def _create(self, model: str, **options: Any) -> "BaseChatModel":
+        try:
+            import httpx
+            from langchain_openai import ChatOpenAI
+        except ImportError as e:
+            raise ConfigError(
+                "The openai-compatible provider requires the openai extra. "
+                "Install it with: pip install 'jj-aidesc[openai]'"
+            ) from e
+
+        # One connection pool for all models of this server
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(keepalive_expiry=KEEPALIVE_SECONDS)
+            )
+        return ChatOpenAI(
+            model=model,
+            base_url=self.base_url,
+            api_key=self._api_key,  # type: ignore[arg-type]
+            temperature=self.temperature,
+            max_retries=0,
+            http_client=self._http_client,
+            **options,
+        )
+
+    def _connect(self, chat_model: Any) -> None:
+        chat_model.root_client.models.list()
+
+
+def _google_genai(config: Config, model: Optional[str]) -> Provider:
     return GoogleGenAIProvider(
         api_key=config.api_key,
-        model=config.model,
+        model=model,
+        temperature=config.temperature,
+        summary_model=config.summary_model,
+    )
+
+
+def _openai_compatible(config: Config, model: Optional[str]) -> Provider:
+    settings = config.provider_settings("openai-compatible")
+    return OpenAICompatibleProvider(
+        base_url=settings.get("base_url", "http://localhost:11434/v1"),
+        model=model,
         temperature=config.temperature,
+        api_key=settings.get("api_key"),
+        summary_model=settings.get("summary_model"),
     )
+
+
+PROVIDERS: dict[str, Callable[[Config, Optional[str]], Provider]] = {
+    DEFAULT_PROVIDER: _google_genai,
+    "openai-compatible": _openai_compatible,
+}
+
+
+def get_provider(
+    config: Config, name: Optional[str] = None, model: Optional[str] = None
+) -> Provider:
+    """Create a provider by name, defaulting to the configured provider and model.
+
+    The --model option applies to the default provider only; other providers
+    use the model of their config section.
+    """
+    name = name or config.provider
+    if name not in PROVIDERS:
+        raise ConfigError(
+            f"Unknown provider: {name} (available: {', '.join(PROVIDERS)})"
+        )
+    if model is None and name == config.provider:
+        model = config.model
+    elif model is None:
+        model = config.provider_settings(name).get("model")
+    return PROVIDERS[name](config, model)
+
+
+def warm_up(providers: list[Provider]) -> None:
+    """Warm up providers in a background thread, not waiting for it."""
+
+    def run() -> None:
+        for provider in providers:
+            provider.warm_up()
+
+    threading.Thread(target=run, name="jj-aidesc-warm-up", daemon=True).start()
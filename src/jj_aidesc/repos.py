@@ -0,0 +1,39 @@
+"""Discovery of the repositories described together with --repos."""
+
+import glob
+import logging
+from pathlib import Path
+
+from jj_aidesc.error import InputError
+
+log = logging.getLogger(__name__)
+
+
+def discover_repos(spec: str) -> list[Path]:
+    """Resolve --repos to the root directories of jj repositories.
+
+    `spec` is either a file listing one directory per line (blank lines and
+    `#` comments are skipped, relative paths are relative to the file) or
+    a glob pattern such as `work/*`, where `**` matches any depth.
+    Directories without a `.jj` directory are skipped.
+    """
+    path = Path(spec).expanduser()
+    if path.is_file():
+        candidates = [
+            path.parent / Path(line.strip()).expanduser()
+            for line in path.read_text().splitlines()
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+    else:
+        candidates = [Path(match) for match in glob.glob(str(path), recursive=True)]
+
+    repos: set[Path] = set()
+    for candidate in candidates:
+        if (candidate / ".jj").is_dir():
+            repos.add(candidate.resolve())
+        elif candidate.is_dir():
+            log.debug(f"Skipping {candidate}: not a jj repository")
+
+    if not repos:
+        raise InputError(f"No jj repositories found for --repos {spec}")
+    return sorted(repos)
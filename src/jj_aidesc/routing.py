@@ -0,0 +1,112 @@
+"""Per-commit model routing."""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from jj_aidesc.error import ConfigError
+
+if TYPE_CHECKING:
+    from jj_aidesc.ai import AI, Generation, OnPartial
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    """Send diffs within the given limits to a provider and model.
+
+    Unset limits match any diff; unset provider or model fall back to the
+    configured defaults.
+    """
+
+    provider: str | None = None
+    model: str | None = None
+    max_chars: int | None = None
+    max_files: int | None = None
+
+    @classmethod
+    def from_config(cls, data: Any) -> "RoutingRule":
+        if not isinstance(data, dict):
+            raise ConfigError(f"Invalid routing rule: {data!r}")
+        unknown = set(data) - {"provider", "model", "max_chars", "max_files"}
+        if unknown:
+            raise ConfigError(
+                f"Unknown routing rule keys: {', '.join(sorted(unknown))}"
+            )
+        try:
+            return cls(
+                provider=data.get("provider"),
+                model=data.get("model"),
+                max_chars=_optional_int(data.get("max_chars")),
+                max_files=_optional_int(data.get("max_files")),
+            )
+        except ValueError as e:
+            raise ConfigError(f"Invalid routing rule {data!r}: {e}") from e
+
+    def matches(self, diff: str) -> bool:
+        if self.max_chars is not None and len(diff) > self.max_chars:
+            return False
+        if self.max_files is not None and count_files(diff) > self.max_files:
+            return False
+        return True
+
+    def describe(self) -> str:
+        limits = []
+        if self.max_chars is not None:
+            limits.append(f"≤{self.max_chars} chars")
+        if self.max_files is not None:
+            limits.append(f"≤{self.max_files} files")
+        return " ".join(limits) or "any"
+
+
+def _optional_int(value: Any) -> int | None:
+    return None if value is None else int(value)
+
+
+def count_files(diff: str) -> int:
+    return sum(1 for line in diff.splitlines() if line.startswith("diff --git "))
+
+
+class Router:
+    """Dispatch each diff to the AI of the first matching rule, else the default.
+
+    Offers the generation interface of AI, so it can be used in its place.
+    A diff always maps to the same AI, so regeneration continues the
+    conversation with the model that wrote the first draft.
+    """
+
+    def __init__(self, default: "AI", routes: list[tuple[RoutingRule, "AI"]]):
+        self.default = default
+        self.routes = routes
+
+    def select(self, diff: str) -> "AI":
+        for rule, ai in self.routes:
+            if rule.matches(diff):
+                return ai
+        return self.default
+
+    def reset_history(self) -> None:
+        for ai in self._all():
+            ai.reset_history()
+
+    def start_history(self, description: str) -> None:
+        for ai in self._all():
+            ai.start_history(description)
+
+    def generate(
+        self,
+        diff: str,
+        feedback: str | None = None,
+        on_partial: "OnPartial | None" = None,
+    ) -> str:
+        return self.select(diff).generate(diff, feedback, on_partial)
+
+    def generate_detached(
+        self, diff: str, on_partial: "OnPartial | None" = None
+    ) -> "Generation":
+        return self.select(diff).generate_detached(diff, on_partial)
+
+    def generate_batch(self, diffs: dict[str, str]) -> dict[str, "Generation"]:
+        # Routed by the batch as a whole, which is what the model receives
+        return self.select("".join(diffs.values())).generate_batch(diffs)
+
+    def _all(self) -> list["AI"]:
+        return [self.default, *(ai for _, ai in self.routes)]
@@ -0,0 +1,149 @@
+"""Rate limiting and retries for model requests."""
+
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable
+from typing import TypeVar
+
+from jj_aidesc.instrument import tracer
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Rough size of a token for quota accounting before the real usage is known
+CHARS_PER_TOKEN = 4
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_MARKERS = (
+    "429",
+    "RESOURCE_EXHAUSTED",
+    "UNAVAILABLE",
+    "DEADLINE_EXCEEDED",
+    "rate limit",
+    "quota",
+    "timed out",
+    "timeout",
+)
+
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN + 1
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error looks like a rate limit or a transient server failure.
+
+    Provider clients raise their own exception types, so this checks status
+    codes and well-known markers on the error and its causes.
+    """
+    current: BaseException | None = error
+    while current is not None:
+        for attribute in ("status_code", "code", "status"):
+            value = getattr(current, attribute, None)
+            value = getattr(value, "value", value)  # enums such as grpc.StatusCode
+            if isinstance(value, int) and value in RETRYABLE_STATUS:
+                return True
+        if isinstance(current, (TimeoutError, ConnectionError)):
+            return True
+        message = str(current)
+        if any(marker.lower() in message.lower() for marker in RETRYABLE_MARKERS):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+class TokenBucket:
+    """Allowance of `per_minute` units, refilled continuously.
+
+    Callers reserve units up front and are told how long to wait; the
+    balance may go negative, which queues later callers behind them.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.balance = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(
+            self.capacity, self.balance + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units and return the seconds to wait before using them."""
+        self._refill()
+        self.balance -= min(amount, self.capacity)
+        return max(0.0, -self.balance / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Correct a reservation once the real amount is known."""
+        self._refill()
+        self.balance = min(self.capacity, self.balance - amount)
+
+
+class Scheduler:
+    """Dispatch model requests within RPM/TPM quotas, retrying transient errors.
+
+    Each request reserves one request and its estimated prompt tokens before
+    it is sent; retryable failures are retried with jittered exponential
+    backoff up to `max_retries` times.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.max_retries = max_retries
+        self._requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable[[], T], estimated_tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            self._acquire(estimated_tokens)
+            try:
+                return func()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+                attempt += 1
+                tracer.count("retries")
+                log.info(
+                    f"Retrying model request in {delay:.1f}s "
+                    f"({attempt}/{self.max_retries}): {e}"
+                )
+                time.sleep(delay)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Charge the difference between estimated and reported tokens."""
+        if self._tokens and actual_tokens:
+            with self._lock:
+                self._tokens.adjust(actual_tokens - estimated_tokens)
+
+    def _acquire(self, estimated_tokens: int) -> None:
+        with self._lock:
+            wait = 0.0
+            if self._requests:
+                wait = max(wait, self._requests.reserve(1))
+            if self._tokens:
+                wait = max(wait, self._tokens.reserve(estimated_tokens))
+        if wait > 0:
+            tracer.count("rate limit waits")
+            with tracer.span("rate limit wait", "scheduler"):
+                time.sleep(wait)
@@ -2,8 +2,6 @@ import logging
 from functools import partial
 from typing import Type, Union
 
-from halo import Halo
-
 log = logging.getLogger(__name__)
 
 
@@ -58,4 +56,7 @@ def get_spinner(verbose: bool) -> Union[Type[LogSpinner], partial]:
     """
     if verbose:
         return LogSpinner
+
+    from halo import Halo
+
     return partial(Halo, spinner="dots")
@@ -0,0 +1,33 @@
+"""Atomic writes of the JSON files kept in the .jj directory."""
+
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+def write_json(path: Path, data: Any, what: str) -> bool:
+    """Replace `path` with `data` as JSON, returning whether it was written.
+
+    The file is written next to `path` and renamed over it, so readers
+    never see a partial file. The stored files only save work that can be
+    redone, so I/O failures are logged as a warning naming `what` and
+    otherwise ignored.
+    """
+    tmp = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        return True
+    except OSError as e:
+        log.warning(f"Failed to write {what} {path}: {e}")
+        if tmp is not None:
+            Path(tmp).unlink(missing_ok=True)
+        return False
@@ -0,0 +1,108 @@
+"""Index of existing descriptions for the 'follow' style."""
+
+import json
+import logging
+import posixpath
+from dataclasses import asdict
+from pathlib import Path
+
+from jj_aidesc.error import JJError
+from jj_aidesc.instrument import tracer
+from jj_aidesc.jj import DescribedCommit, JJClient
+from jj_aidesc.storage import write_json
+
+log = logging.getLogger(__name__)
+
+STYLE_INDEX_FILE_NAME = "aidesc-style-index.json"
+STYLE_INDEX_VERSION = 1
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_EXAMPLES = 5
+
+
+class StyleIndex:
+    """Descriptions of the repository's described commits and the files they touched.
+
+    The index is stored with the jj operation it was built at; an update
+    only reads the commits described since then, so history is scanned
+    once per repository rather than once per run. Only the newest
+    `max_entries` commits are kept.
+    """
+
+    def __init__(self, path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.operation: str | None = None
+        # Oldest first, so the newest commits win ties when selecting
+        self.entries: dict[str, DescribedCommit] = {}
+        self._load()
+
+    def update(self, jj: JJClient) -> None:
+        """Add the commits described since the indexed operation."""
+        operation = jj.get_operation_id()
+        if operation == self.operation:
+            return
+
+        with tracer.span("update style index", "jj") as span:
+            try:
+                commits = jj.get_described_commits(self.operation, self.max_entries)
+            except JJError as e:
+                if self.operation is None:
+                    raise
+                # The indexed operation may have been garbage collected
+                log.info(f"Rebuilding style index: {e}")
+                self.entries = {}
+                commits = jj.get_described_commits(limit=self.max_entries)
+            span["commits"] = len(commits)
+
+        for commit in reversed(commits):  # Oldest first
+            self.entries.pop(commit.change_id, None)
+            self.entries[commit.change_id] = commit
+        if len(self.entries) > self.max_entries:
+            self.entries = dict(list(self.entries.items())[-self.max_entries :])
+
+        self.operation = operation
+        self._save()
+
+    def select(self, paths: list[str], count: int = DEFAULT_EXAMPLES) -> list[str]:
+        """Pick the descriptions of the commits that best overlap `paths`.
+
+        A shared file counts most, then a shared directory; ties and commits
+        without overlap are ordered newest first.
+        """
+        files = set(paths)
+        directories = {posixpath.dirname(path) for path in paths}
+
+        def score(entry: DescribedCommit) -> int:
+            return sum(
+                2 if path in files else 1
+                for path in entry.files
+                if path in files or posixpath.dirname(path) in directories
+            )
+
+        entries = list(reversed(self.entries.values()))
+        entries.sort(key=score, reverse=True)
+        return [entry.description for entry in entries[:count]]
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") != STYLE_INDEX_VERSION:
+                return
+            self.entries = {
+                entry["change_id"]: DescribedCommit(**entry)
+                for entry in data["entries"]
+            }
+            self.operation = data["operation"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning(f"Ignoring unreadable style index {self.path}: {e}")
+            self.entries = {}
+
+    def _save(self) -> None:
+        data = {
+            "version": STYLE_INDEX_VERSION,
+            "operation": self.operation,
+            "entries": [asdict(entry) for entry in self.entries.values()],
+        }
+        write_json(self.path, data, "style index")
@@ -0,0 +1,82 @@
+"""Detection of new commits for the watch subcommand."""
+
+import logging
+import os
+
+from jj_aidesc.jj import Commit, JJClient
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 2.0
+
+
+class Watcher:
+    """Follow jj operations and report commits that need a description.
+
+    The operation heads are listed on every poll, which is cheap and needs
+    no jj process; only when they change is jj asked for the commits that
+    appeared since the last seen operation. Commits are remembered by
+    change ID and commit ID, so each version of a commit is reported once.
+    """
+
+    def __init__(
+        self,
+        jj: JJClient,
+        revset: str,
+        include_described: bool = False,
+        context: int | None = None,
+    ):
+        self.jj = jj
+        self.revset = revset
+        self.include_described = include_described
+        self.context = context
+        self.seen: dict[str, str] = {}
+        self._operation: str | None = None
+        self._heads_dir = jj.get_op_heads_dir()
+        self._heads: frozenset[str] | None = None
+
+    def poll(self) -> list[Commit]:
+        """Return new or rewritten commits; the first poll returns all of them."""
+        if not self._heads_changed():
+            return []
+        operation = self.jj.get_operation_id()
+        if operation == self._operation:
+            return []
+
+        commits = self.jj.get_commits_without_description(
+            self.revset,
+            self.include_described,
+            with_diff=True,
+            since_operation=self._operation,
+            context=self.context,
+        )
+        self._operation = operation
+
+        new = [c for c in commits if self.seen.get(c.change_id) != c.commit_id]
+        for commit in new:
+            self.seen[commit.change_id] = commit.commit_id
+        return new
+
+    def reset(self, commits: list[Commit] | None = None) -> None:
+        """Rescan on the next poll, e.g. after a failed jj command.
+
+        `commits` are reported again, for when their generation failed.
+        """
+        self._operation = None
+        self._heads = None
+        for commit in commits or []:
+            self.seen.pop(commit.change_id, None)
+
+    def _heads_changed(self) -> bool:
+        if self._heads_dir is None:
+            return True
+        try:
+            heads = frozenset(os.listdir(self._heads_dir))
+        except OSError as e:
+            # Heads are replaced while jj commits an operation
+            log.debug(f"Could not list operation heads: {e}")
+            return True
+        if heads == self._heads:
+            return False
+        self._heads = heads
+        return True